@@ -1,17 +1,39 @@
 """PreuploadAdminMixin: PreuploadFormMixin for admin and inlines."""
 
-from django.contrib import admin
+from django.contrib.admin.options import BaseModelAdmin
 
 from .forms import PreuploadFormMixin
 
 
-class PreuploadAdminMixin(admin.ModelAdmin):
+def _preupload_form_class(form_class):
+    """Return form_class with PreuploadFormMixin mixed in; memoized on form_class."""
+    if issubclass(form_class, PreuploadFormMixin):
+        return form_class
+    new_form = form_class.__dict__.get("_preupload_form_class")
+    if new_form is None:
+        new_form = type("FormWithPreupload", (PreuploadFormMixin, form_class), {})
+        form_class._preupload_form_class = new_form
+    return new_form
+
+
+def _preupload_formset_class(formset_class):
+    """Return formset_class using the preupload form; memoized on formset_class."""
+    new_formset = formset_class.__dict__.get("_preupload_formset_class")
+    if new_formset is None:
+        new_form = _preupload_form_class(formset_class.form)
+        new_formset = type("FormSetWithPreupload", (formset_class,), {"form": new_form})
+        formset_class._preupload_formset_class = new_formset
+    return new_formset
+
+
+class PreuploadAdminMixin(BaseModelAdmin):
+    # Django builds the form class per request (its formfield_callback carries the
+    # request, e.g. for related-object permissions), so it is wrapped per call and
+    # not cached; its fields are still prepared once per class, not once per form.
     def get_form(self, request, obj=None, **kwargs):
         form_class = super().get_form(request, obj=obj, **kwargs)
-        return type("FormWithPreupload", (PreuploadFormMixin, form_class), {})
+        return _preupload_form_class(form_class)
 
     def get_formset(self, request, obj=None, **kwargs):
         formset_class = super().get_formset(request, obj=obj, **kwargs)
-        form_class = formset_class.form
-        new_form = type("FormWithPreupload", (PreuploadFormMixin, form_class), {})
-        return type("FormSetWithPreupload", (formset_class,), {"form": new_form})
+        return _preupload_formset_class(formset_class)
@@ -4,8 +4,26 @@ from django.conf import settings
 
 _DEFAULTS = {
     "STORAGE": None,
+    "STRIPING": "hash",
+    "HOT_CACHE": None,
     "TTL_MINUTES": 60,
     "MAX_UPLOAD_SIZE": None,
+    "WIDGET_CONFIG_ATTRS": True,
+    "WIDGET_INLINE_RENDER": False,
+    "KEY_LAYOUT": "flat",
+    "KEY_SHARD_DEPTH": 0,
+    "PROCESSORS": [],
+    "PROCESSING": {
+        "BACKEND": "preupload.processing.ThreadPoolBackend",
+        "OPTIONS": {},
+        "TIMEOUT": 10,
+    },
+    "POLICY_MAX_AGE": None,
+    "SENDFILE": None,
+    "CLEANUP_LEASE_SECONDS": 300,
+    "DATABASE": None,
+    "STATS": False,
+    "REGISTRY": {"BACKEND": "preupload.registry.ModelRegistry", "OPTIONS": {}},
 }
 
 _user = getattr(settings, "PREUPLOAD", {})
@@ -4,29 +4,57 @@ import copy
 
 from django import forms
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import router
 
+from .ingest import DEFAULT_CONTENT_TYPE
+from .models import Preupload
+from . import policies
+from . import processing
 from .storage import storage
 from . import tokens
 from .widgets import PreuploadClearableFileWidget, PreuploadFileWidget
 
 
 def _wrap_preupload_as_uploaded_file(preupload):
-    """Open preuploaded file and wrap as UploadedFile-like for form validation."""
+    """
+    Open preuploaded file and wrap as UploadedFile-like for form validation; the
+    record rides along as .preupload for tokens.release_uploaded_file().
+    """
     f = storage.open(preupload.storage_ref)
     content = f.read()
     f.close()
-    return SimpleUploadedFile(
+    uploaded = SimpleUploadedFile(
         name=preupload.original_filename,
         content=content,
-        content_type="application/octet-stream",
+        content_type=preupload.content_type or DEFAULT_CONTENT_TYPE,
     )
+    uploaded.preupload = preupload
+    return uploaded
 
 
-def _resolve_token_to_uploaded(token):
-    """Resolve preupload token to SimpleUploadedFile; raise ValidationError on failure."""
+def _resolve_token_to_uploaded(token, policy=None):
+    """
+    Resolve preupload token to SimpleUploadedFile; raise ValidationError on failure,
+    including when the file was uploaded under a different policy than the field's.
+    """
     preupload = tokens.resolve_preupload_token(token.strip())
     if preupload is None:
         raise forms.ValidationError("Invalid or expired upload. Please upload again.")
+    if preupload.policy_digest != policies.policy_digest(policy):
+        raise forms.ValidationError(
+            "This upload was not made for this field. Please upload again."
+        )
+    preupload = processing.wait_for_verdict(preupload)
+    if preupload.status == Preupload.STATUS_PENDING:
+        raise forms.ValidationError(
+            "The upload is still being processed. Please try again shortly."
+        )
+    if preupload.status == Preupload.STATUS_REJECTED:
+        raise forms.ValidationError((preupload.result or {}).get("errors") or [])
+    if preupload.status == Preupload.STATUS_ERROR:
+        raise forms.ValidationError(
+            "The upload could not be processed. Please upload again."
+        )
     try:
         return _wrap_preupload_as_uploaded_file(preupload)
     except Exception:
@@ -53,7 +81,9 @@ class PreuploadFileField(forms.FileField):
         token = (value if isinstance(value, str) else "") or ""
         if not token.strip():
             return super().clean(value, initial=initial)
-        uploaded = _resolve_token_to_uploaded(token)
+        uploaded = _resolve_token_to_uploaded(
+            token, getattr(self.widget, "policy", None)
+        )
         return super().clean(uploaded, initial=initial)
 
 
@@ -74,7 +104,9 @@ class PreuploadImageField(forms.ImageField):
         token = (value if isinstance(value, str) else "") or ""
         if not token.strip():
             return super().clean(value, initial=initial)
-        uploaded = _resolve_token_to_uploaded(token)
+        uploaded = _resolve_token_to_uploaded(
+            token, getattr(self.widget, "policy", None)
+        )
         return super().clean(uploaded, initial=initial)
 
 
@@ -84,44 +116,81 @@ class PreuploadFormMixin:
     File data is only from the preupload token (not from request.FILES).
     Widget: clearable when field is not required, else non-clearable.
     Override preupload_field_widgets with (field_type, widget_class) tuples to customize.
+    preupload_policies maps field names to upload policies (see PreuploadWidgetMixin).
     """
 
     preupload_field_widgets = ()  # optional override; default is by field.required
+    preupload_policies = {}  # optional: {field name: upload policy dict}
     preupload_skip_fields = ()  # optional: list of field names to skip (e.g. for ModelForm)
 
     def __init__(self, *args, **kwargs):
         kwargs.pop("request", None)
+        cls = type(self)
+        if "_preupload_prepared" not in cls.__dict__:
+            cls._prepare_preupload_fields()
         super().__init__(*args, **kwargs)
         self._wrap_file_fields()
 
-    def _get_preupload_widget_class(self, field):
-        for field_cls, widget_cls in self.preupload_field_widgets:
+    @classmethod
+    def _get_preupload_widget_class(cls, field):
+        for field_cls, widget_cls in cls.preupload_field_widgets:
             if isinstance(field, field_cls):
                 return widget_cls
         return (
             PreuploadClearableFileWidget if not field.required else PreuploadFileWidget
         )
 
-    def _wrap_file_fields(self):
+    @classmethod
+    def _make_preupload_field(cls, name, field):
+        """Return a preupload copy of field, or None if it should be left as is."""
         from django.forms import FileField as BaseFileField
         from django.forms import ImageField
 
-        skip_names = getattr(self, "preupload_skip_fields", ())
+        skip_names = getattr(cls, "preupload_skip_fields", ())
+        if name in skip_names or getattr(field, "preupload_skip", False):
+            return None
+        if isinstance(field, (PreuploadFileField, PreuploadImageField)):
+            return None
+        if not isinstance(field, (BaseFileField, ImageField)):
+            return None
+        new_field = copy.copy(field)
+        new_field.__class__ = (
+            PreuploadImageField if isinstance(field, ImageField) else PreuploadFileField
+        )
+        new_field._preupload_name = name
+        widget_kwargs = {"attrs": field.widget.attrs}
+        if name in cls.preupload_policies:
+            widget_kwargs["policy"] = cls.preupload_policies[name]
+        new_field.widget = cls._get_preupload_widget_class(field)(**widget_kwargs)
+        return new_field
+
+    @classmethod
+    def _prepare_preupload_fields(cls):
+        """Wrap file fields in base_fields once per class; instances get them via Django's deepcopy."""
+        base_fields = dict(cls.base_fields)
+        for name, field in cls.base_fields.items():
+            new_field = cls._make_preupload_field(name, field)
+            if new_field is not None:
+                base_fields[name] = new_field
+        cls.base_fields = base_fields
+        cls._preupload_prepared = True
+
+    def release_preuploads(self, using=None):
+        """
+        Release the preuploads behind this form's cleaned files once they are saved
+        elsewhere (counted as consumed). ModelForms do this in save()/save_m2m().
+        """
+        for value in getattr(self, "cleaned_data", {}).values():
+            tokens.release_uploaded_file(value, using=using)
+
+    def _save_m2m(self):
+        # Runs after the instance is saved, for save() and for save(commit=False) + save_m2m().
+        super()._save_m2m()
+        self.release_preuploads(using=router.db_for_write(type(self.instance)))
+
+    def _wrap_file_fields(self):
+        """Wrap file fields added after class preparation (e.g. in a base form's __init__)."""
         for name, field in list(self.fields.items()):
-            if name in skip_names or getattr(field, "preupload_skip", False):
-                continue
-            if isinstance(field, (PreuploadFileField, PreuploadImageField)):
-                continue
-            if not isinstance(field, (BaseFileField, ImageField)):
-                continue
-            new_field = copy.copy(field)
-            new_field.__class__ = (
-                PreuploadImageField
-                if isinstance(field, ImageField)
-                else PreuploadFileField
-            )
-            new_field._preupload_name = name
-            new_field.widget = self._get_preupload_widget_class(field)(
-                attrs=field.widget.attrs
-            )
-            self.fields[name] = new_field
+            new_field = self._make_preupload_field(name, field)
+            if new_field is not None:
+                self.fields[name] = new_field
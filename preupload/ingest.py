@@ -0,0 +1,119 @@
+"""Single-pass ingest: byte count, SHA-256 and sniffed content type while storage reads the upload."""
+
+import hashlib
+from collections import namedtuple
+
+DEFAULT_CONTENT_TYPE = "application/octet-stream"
+HEAD_SIZE = 32
+
+IngestResult = namedtuple(
+    "IngestResult", ["storage_ref", "size", "sha256", "content_type"]
+)
+
+# (offset, magic bytes, content type); first match wins.
+_SIGNATURES = (
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"GIF87a", "image/gif"),
+    (0, b"GIF89a", "image/gif"),
+    (0, b"BM", "image/bmp"),
+    (0, b"II*\x00", "image/tiff"),
+    (0, b"MM\x00*", "image/tiff"),
+    (0, b"\x00\x00\x01\x00", "image/x-icon"),
+    (0, b"%PDF-", "application/pdf"),
+    (0, b"PK\x03\x04", "application/zip"),
+    (0, b"PK\x05\x06", "application/zip"),
+    (0, b"\x1f\x8b", "application/gzip"),
+    (0, b"7z\xbc\xaf\x27\x1c", "application/x-7z-compressed"),
+    (0, b"Rar!\x1a\x07", "application/vnd.rar"),
+    (0, b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "application/x-ole-storage"),
+    (0, b"OggS", "application/ogg"),
+    (0, b"fLaC", "audio/flac"),
+    (0, b"ID3", "audio/mpeg"),
+    (0, b"\x1aE\xdf\xa3", "video/webm"),
+    (4, b"ftyp", "video/mp4"),
+)
+
+
+def sniff_content_type(head):
+    """Return content type from the leading bytes of a file (magic numbers), or the default."""
+    if head[:4] == b"RIFF" and len(head) >= 12:
+        kind = head[8:12]
+        if kind == b"WEBP":
+            return "image/webp"
+        if kind == b"WAVE":
+            return "audio/wav"
+        if kind == b"AVI ":
+            return "video/x-msvideo"
+    for offset, magic, content_type in _SIGNATURES:
+        if head[offset : offset + len(magic)] == magic:
+            return content_type
+    return DEFAULT_CONTENT_TYPE
+
+
+class IngestReader:
+    """
+    File-like proxy that hashes and counts bytes as they are read.
+    Seeking to 0 restarts the pass; any other seek marks it non-sequential.
+    complete is True only after one sequential pass from 0 to EOF.
+    """
+
+    def __init__(self, file):
+        self._file = file
+        self._reset()
+
+    def _reset(self):
+        self._count = 0
+        self._sha256 = hashlib.sha256()
+        self._head = b""
+        self._sequential = True
+        self._eof = False
+
+    def read(self, size=-1):
+        data = self._file.read(size)
+        if self._sequential:
+            if data:
+                self._count += len(data)
+                self._sha256.update(data)
+                if len(self._head) < HEAD_SIZE:
+                    self._head += data[: HEAD_SIZE - len(self._head)]
+            if not data or size is None or size < 0:
+                self._eof = True
+        return data
+
+    def seek(self, offset, whence=0):
+        result = self._file.seek(offset, whence)
+        if offset == 0 and whence == 0:
+            self._reset()
+        else:
+            self._sequential = False
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    @property
+    def size(self):
+        # The wrapped upload's size, not the bytes read so far: backends pass
+        # File(reader).size as the content length.
+        return self._file.size
+
+    @property
+    def complete(self):
+        return self._sequential and self._eof
+
+    @property
+    def sha256(self):
+        return self._sha256.hexdigest()
+
+    @property
+    def content_type(self):
+        return sniff_content_type(self._head)
+
+    def finish(self):
+        """Ensure a full pass was observed; re-read the local source once if the backend didn't do one."""
+        if not self.complete:
+            self.seek(0)
+            while self.read(64 * 2**10):
+                pass
+        return self._count, self.sha256, self.content_type
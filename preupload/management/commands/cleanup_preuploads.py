@@ -1,17 +1,24 @@
 """Delete expired preuploads and their preuploaded files (by created_at + TTL)."""
 
+import time
 from datetime import timedelta
 
 from django.utils import timezone
 from django.core.management.base import BaseCommand
 
+from preupload import stats
 from preupload.conf import preupload_config
-from preupload.models import Preupload
+from preupload.registry import registry
 from preupload.storage import storage
 
+BATCH_SIZE = 500
+
 
 class Command(BaseCommand):
-    help = "Remove expired preupload records and their preuploaded files."
+    help = (
+        "Remove expired preupload records and their preuploaded files. "
+        "Safe to run from several workers or hosts at once."
+    )
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -19,25 +26,132 @@ class Command(BaseCommand):
             action="store_true",
             help="Only report what would be deleted.",
         )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=BATCH_SIZE,
+            help="Records claimed per batch (default %d)." % BATCH_SIZE,
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Run continuously, sleeping less while there is a backlog.",
+        )
+        parser.add_argument(
+            "--min-sleep",
+            type=float,
+            default=1.0,
+            help="Seconds to sleep in --loop mode after a full batch (default 1).",
+        )
+        parser.add_argument(
+            "--max-sleep",
+            type=float,
+            default=300.0,
+            help="Longest sleep in --loop mode when idle (default 300).",
+        )
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            default=0,
+            help="Stop --loop mode after this many passes (default: run forever).",
+        )
 
     def handle(self, *args, **options):
-        dry_run = options["dry_run"]
+        if not options["loop"]:
+            self.run_once(options["dry_run"], options["batch_size"])
+            return
+        sleep = options["min_sleep"]
+        iterations = 0
+        try:
+            while True:
+                found = self.run_once(options["dry_run"], options["batch_size"])
+                iterations += 1
+                if options["iterations"] and iterations >= options["iterations"]:
+                    break
+                # Backlog: come back quickly; idle: back off exponentially.
+                if found >= options["batch_size"]:
+                    sleep = options["min_sleep"]
+                elif found:
+                    sleep = max(sleep / 2, options["min_sleep"])
+                else:
+                    sleep = min(sleep * 2, options["max_sleep"])
+                time.sleep(sleep)
+        except KeyboardInterrupt:
+            pass
+
+    def run_once(self, dry_run, batch_size):
+        """One cleanup pass; return the number of preuploads removed (or found, for dry runs)."""
         cutoff = timezone.now() - timedelta(minutes=preupload_config["TTL_MINUTES"])
-        qs = Preupload.objects.filter(created_at__lt=cutoff)
+        buckets = storage.expired_buckets(cutoff)
+        if dry_run:
+            count = sum(1 for _ in registry.expired(cutoff))
+            if registry.expires_records:
+                count += sum(1 for _ in storage.expired_refs(cutoff))
+            self.stdout.write("Would delete %d expired preupload(s)." % count)
+            if buckets:
+                self.stdout.write("Would drop %d expired bucket(s)." % len(buckets))
+            return count
+        # Whole expired time buckets go in one call each; their records skip per-file deletes.
+        for bucket in buckets:
+            try:
+                storage.delete_bucket(bucket)
+            except Exception as e:
+                self.stderr.write("Failed to delete bucket %s: %s" % (bucket, e))
         count = 0
-        for preupload in qs.iterator():
-            if not dry_run:
+        failed = set()
+        while True:
+            with registry.claim_expired(cutoff, batch_size, exclude=failed) as claimed:
+                if claimed:
+                    registry.delete_many(claimed)
+            if not claimed:
+                break
+            # Files go after the records, once the claim has committed, and only when
+            # no record references them any more: the last holder of a shared file
+            # removes it even if other workers deleted its duplicates concurrently.
+            retry = self._delete_unreferenced(claimed, cutoff)
+            # Put back records are left to the next run, not claimed again in this pass.
+            failed.update(p.pk for p in retry)
+            failed_refs = {p.storage_ref for p in retry}
+            deleted = [p for p in claimed if p.storage_ref not in failed_refs]
+            stats.record_outcome(
+                "expired", len(deleted), sum(p.size or 0 for p in deleted)
+            )
+            count += len(deleted)
+        if registry.expires_records:
+            # Records expire on their own; sweep orphaned files by modification time.
+            swept = 0
+            for storage_ref in storage.expired_refs(cutoff):
                 try:
-                    storage.delete(preupload.storage_ref)
-                    preupload.delete()
-                    count += 1
+                    storage.delete(storage_ref)
+                    swept += 1
                 except Exception as e:
                     self.stderr.write(
-                        "Failed to delete storage for pk=%s: %s" % (preupload.pk, e)
+                        "Failed to delete storage %s: %s" % (storage_ref, e)
                     )
-            else:
-                count += 1
-        if dry_run:
-            self.stdout.write("Would delete %d expired preupload(s)." % count)
-        else:
-            self.stdout.write("Deleted %d expired preupload(s)." % count)
+            stats.record_outcome("expired", swept)
+            count += swept
+        self.stdout.write("Deleted %d expired preupload(s)." % count)
+        if buckets:
+            self.stdout.write("Dropped %d expired bucket(s)." % len(buckets))
+        return count
+
+    def _delete_unreferenced(self, records, cutoff):
+        """
+        Delete the files of records that no record references any more. When a delete
+        fails, put one (still expired) record back for the file so a later run
+        retries it; return those records.
+        """
+        refs = {
+            p.storage_ref
+            for p in records
+            if not storage.in_expired_bucket(p.storage_ref, cutoff)
+        }
+        retry = []
+        for storage_ref in refs - registry.live_refs(refs):
+            try:
+                storage.delete(storage_ref)
+            except Exception as e:
+                self.stderr.write("Failed to delete storage %s: %s" % (storage_ref, e))
+                record = next(p for p in records if p.storage_ref == storage_ref)
+                retry.append(registry.duplicate(record))
+        return retry
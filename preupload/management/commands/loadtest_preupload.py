@@ -0,0 +1,272 @@
+"""In-process load test: preupload endpoint + form-submit round trip; reports throughput and latency per stage."""
+
+import json
+import os
+import random
+import threading
+import time
+
+from django import forms
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+
+from preupload import tokens
+from preupload.forms import PreuploadFormMixin
+
+STAGES = ("preupload", "submit")
+_UNITS = {"k": 1024, "m": 1024 * 1024, "g": 1024 * 1024 * 1024}
+
+
+class _LoadTestForm(PreuploadFormMixin, forms.Form):
+    file = forms.FileField()
+
+
+def parse_size(value):
+    """'512', '100k', '2m' -> bytes."""
+    value = value.strip().lower()
+    if value and value[-1] in _UNITS:
+        return int(float(value[:-1]) * _UNITS[value[-1]])
+    return int(value)
+
+
+def parse_sizes(value):
+    """'1k:5,1m:1' -> ([1024, 1048576], [5, 1]); weight defaults to 1."""
+    sizes, weights = [], []
+    for item in value.split(","):
+        size, _, weight = item.partition(":")
+        try:
+            sizes.append(parse_size(size))
+            weights.append(float(weight) if weight else 1.0)
+        except ValueError:
+            raise CommandError("Invalid size %r in --sizes." % item)
+    return sizes, weights
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list (None if empty)."""
+    if not sorted_values:
+        return None
+    rank = max(int(round(pct / 100.0 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class _Stats:
+    """Thread-safe latency/error collector per stage."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {stage: [] for stage in STAGES}
+        self.errors = {stage: 0 for stage in STAGES}
+
+    def record(self, stage, seconds, ok):
+        with self._lock:
+            if ok:
+                self.latencies[stage].append(seconds)
+            else:
+                self.errors[stage] += 1
+
+    def report(self, elapsed):
+        result = {}
+        for stage in STAGES:
+            latencies = sorted(self.latencies[stage])
+            ok, errors = len(latencies), self.errors[stage]
+            total = ok + errors
+
+            def ms(value):
+                return None if value is None else round(value * 1000, 2)
+
+            result[stage] = {
+                "requests": total,
+                "errors": errors,
+                "error_rate": round(errors / total, 4) if total else 0.0,
+                "throughput": round(ok / elapsed, 2) if elapsed else 0.0,
+                "p50_ms": ms(percentile(latencies, 50)),
+                "p95_ms": ms(percentile(latencies, 95)),
+                "p99_ms": ms(percentile(latencies, 99)),
+            }
+        return result
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the preupload endpoint and a form-submit round trip in-process "
+        "and report throughput, latency percentiles and error rates per stage."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency", type=int, default=4, help="Worker threads (default 4)."
+        )
+        parser.add_argument(
+            "--duration",
+            type=float,
+            default=10.0,
+            help="Seconds to run (default 10).",
+        )
+        parser.add_argument(
+            "--sizes",
+            default="10k",
+            help="Comma-separated file sizes with optional weights, e.g. '10k:8,1m:2'.",
+        )
+        parser.add_argument(
+            "--submit-url",
+            default=None,
+            help="URL (or URL name) to POST the token to; default validates a "
+            "PreuploadFormMixin form in-process.",
+        )
+        parser.add_argument(
+            "--field",
+            default="file",
+            help="Form field name for --submit-url (posted as <field>_token).",
+        )
+        parser.add_argument(
+            "--host", default=None, help="Host header (default from ALLOWED_HOSTS)."
+        )
+        parser.add_argument(
+            "--seed", type=int, default=None, help="Random seed for file sizes."
+        )
+        parser.add_argument(
+            "--keep",
+            action="store_true",
+            help="Keep created preuploads (default: delete them afterwards).",
+        )
+        parser.add_argument(
+            "--json", action="store_true", help="Print the report as JSON."
+        )
+
+    def handle(self, *args, **options):
+        if options["concurrency"] < 1:
+            raise CommandError("--concurrency must be at least 1.")
+        sizes, weights = parse_sizes(options["sizes"])
+        preupload_url = reverse("preupload:preupload")
+        submit_url = options["submit_url"]
+        if submit_url and not submit_url.startswith("/"):
+            submit_url = reverse(submit_url)
+        host = options["host"] or self._default_host()
+        rng = random.Random(options["seed"])
+        rng_lock = threading.Lock()
+        stats = _Stats()
+        created = []
+        created_lock = threading.Lock()
+        deadline = time.monotonic() + options["duration"]
+
+        def next_size():
+            with rng_lock:
+                return rng.choices(sizes, weights)[0]
+
+        def worker():
+            client = Client(HTTP_HOST=host)
+            try:
+                while time.monotonic() < deadline:
+                    token = self._preupload(client, preupload_url, next_size(), stats)
+                    if token is None:
+                        continue
+                    with created_lock:
+                        created.append(token)
+                    self._submit(client, submit_url, options["field"], token, stats)
+            finally:
+                connections.close_all()
+
+        started = time.monotonic()
+        threads = [
+            threading.Thread(target=worker) for _ in range(options["concurrency"])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        report = {
+            "concurrency": options["concurrency"],
+            "duration": round(elapsed, 3),
+            "sizes": dict(zip(sizes, weights)),
+            "stages": stats.report(elapsed),
+        }
+        if not options["keep"]:
+            self._discard(created)
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self._write_text(report)
+
+    def _default_host(self):
+        for host in getattr(settings, "ALLOWED_HOSTS", []):
+            if host != "*":
+                return host.lstrip(".")
+        return "localhost"
+
+    def _preupload(self, client, url, size, stats):
+        upload = SimpleUploadedFile("loadtest.bin", os.urandom(size))
+        start = time.perf_counter()
+        try:
+            response = client.post(url, {"file": upload})
+            ok = response.status_code == 200
+            token = response.json().get("token") if ok else None
+        except Exception:
+            ok, token = False, None
+        stats.record("preupload", time.perf_counter() - start, ok and bool(token))
+        return token
+
+    def _submit(self, client, url, field, token, stats):
+        start = time.perf_counter()
+        try:
+            if url:
+                response = client.post(url, {field + "_token": token})
+                ok = response.status_code < 400
+            else:
+                form = _LoadTestForm({"file_token": token})
+                ok = form.is_valid()
+                if ok:
+                    form.cleaned_data["file"].read()
+        except Exception:
+            ok = False
+        stats.record("submit", time.perf_counter() - start, ok)
+
+    def _discard(self, created):
+        for token in created:
+            preupload = tokens.resolve_preupload_token(token)
+            if preupload is None:
+                continue
+            try:
+                tokens.release_preupload(preupload, record_stats=False)
+            except Exception as e:
+                self.stderr.write(
+                    "Failed to delete preupload pk=%s: %s" % (preupload.pk, e)
+                )
+
+    def _write_text(self, report):
+        self.stdout.write(
+            "Concurrency %d, %.1fs" % (report["concurrency"], report["duration"])
+        )
+        self.stdout.write(
+            "%-10s %9s %7s %7s %9s %9s %9s %9s"
+            % (
+                "stage",
+                "requests",
+                "errors",
+                "err%",
+                "req/s",
+                "p50 ms",
+                "p95 ms",
+                "p99 ms",
+            )
+        )
+        for stage, row in report["stages"].items():
+            self.stdout.write(
+                "%-10s %9d %7d %6.2f%% %9.2f %9s %9s %9s"
+                % (
+                    stage,
+                    row["requests"],
+                    row["errors"],
+                    row["error_rate"] * 100,
+                    row["throughput"],
+                    row["p50_ms"],
+                    row["p95_ms"],
+                    row["p99_ms"],
+                )
+            )
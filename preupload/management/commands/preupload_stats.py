@@ -0,0 +1,160 @@
+"""Capacity-planning report: outstanding preuploads, age histogram, bytes, consumed vs expired."""
+
+import json
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from preupload import stats
+from preupload.conf import preupload_config
+from preupload.registry import ModelRegistry, registry
+from preupload.storage import storage
+
+
+def default_bins():
+    """Histogram edges in minutes: quarters of TTL_MINUTES."""
+    ttl = preupload_config["TTL_MINUTES"]
+    return sorted({max(ttl * i // 4, 1) for i in range(1, 5)})
+
+
+def parse_bins(value):
+    """'5,15,60' -> [5, 15, 60]."""
+    try:
+        bins = sorted({int(item) for item in value.split(",") if item.strip()})
+    except ValueError:
+        raise CommandError("Invalid --bins %r (comma-separated minutes)." % value)
+    if not bins or bins[0] <= 0:
+        raise CommandError("--bins must be positive minutes.")
+    return bins
+
+
+def format_bytes(n):
+    """1536 -> '1.5 KiB'."""
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if n < 1024 or unit == "GiB":
+            return "%d %s" % (n, unit) if unit == "B" else "%.1f %s" % (n, unit)
+        n /= 1024.0
+
+
+class Command(BaseCommand):
+    help = (
+        "Report outstanding preuploads (count, bytes, age histogram, status) and how "
+        "many were consumed versus expired, using aggregate queries."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--bins",
+            default=None,
+            help="Age histogram edges in minutes, e.g. '5,15,60' "
+            "(default: quarters of TTL_MINUTES).",
+        )
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=7,
+            help="Days of consumed/expired counters to sum (default 7).",
+        )
+        parser.add_argument(
+            "--sample",
+            type=int,
+            default=0,
+            help="Check real file sizes in storage for about N random preuploads.",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=None, help="Random seed for --sample."
+        )
+        parser.add_argument(
+            "--json", action="store_true", help="Print the report as JSON."
+        )
+
+    def handle(self, *args, **options):
+        if options["days"] < 1:
+            raise CommandError("--days must be at least 1.")
+        bins = parse_bins(options["bins"]) if options["bins"] else default_bins()
+        now = timezone.now()
+        report = {
+            "ttl_minutes": preupload_config["TTL_MINUTES"],
+            "outstanding": None,
+            "outcomes": (
+                stats.outcomes(options["days"], now)
+                if preupload_config["STATS"]
+                else None
+            ),
+            "storage_sample": None,
+        }
+        # Other registries keep records outside the database: nothing to aggregate.
+        if isinstance(registry, ModelRegistry):
+            report["outstanding"] = stats.outstanding(now, bins)
+            if options["sample"] > 0:
+                report["storage_sample"] = stats.sample_storage(
+                    storage, options["sample"], random.Random(options["seed"])
+                )
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self._write_text(report)
+
+    def _write_text(self, report):
+        write = self.stdout.write
+        out = report["outstanding"]
+        if out is None:
+            write("Outstanding: not available for %s." % type(registry).__name__)
+        else:
+            write(
+                "Outstanding: %d preupload(s), %s"
+                % (out["count"], format_bytes(out["bytes"]))
+                + (
+                    " (%d without size)" % out["unknown_size"]
+                    if out["unknown_size"]
+                    else ""
+                )
+            )
+            if out["oldest_age_seconds"] is not None:
+                write("Oldest: %.1f min" % (out["oldest_age_seconds"] / 60.0))
+            write(
+                "Past TTL (%d min), awaiting cleanup: %d, %s"
+                % (
+                    report["ttl_minutes"],
+                    out["expired"],
+                    format_bytes(out["expired_bytes"]),
+                )
+            )
+            write("Age histogram:")
+            for label, n in out["age_histogram"].items():
+                write("  %-12s %9d" % (label, n))
+            if out["by_status"]:
+                write("By status:")
+                for status, row in out["by_status"].items():
+                    write(
+                        "  %-12s %9d %12s"
+                        % (status, row["count"], format_bytes(row["bytes"]))
+                    )
+        outcomes = report["outcomes"]
+        if outcomes is None:
+            write('Consumed/expired counters are disabled (PREUPLOAD["STATS"] is off).')
+        else:
+            ratio = outcomes["expired_ratio"]
+            write(
+                "Last %d day(s): %d consumed (%s), %d expired (%s), expired ratio %s"
+                % (
+                    outcomes["days"],
+                    outcomes["consumed"],
+                    format_bytes(outcomes["consumed_bytes"]),
+                    outcomes["expired"],
+                    format_bytes(outcomes["expired_bytes"]),
+                    "n/a" if ratio is None else "%.1f%%" % (ratio * 100),
+                )
+            )
+        sample = report["storage_sample"]
+        if sample is not None:
+            write(
+                "Storage sample: %d checked, %d missing, mean size %s (recorded %s)"
+                % (
+                    sample["sampled"],
+                    sample["missing"],
+                    sample["mean_size"],
+                    sample["mean_recorded_size"],
+                )
+            )
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("preupload", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="preupload",
+            name="content_type",
+            field=models.CharField(blank=True, default="", max_length=255),
+        ),
+        migrations.AddField(
+            model_name="preupload",
+            name="sha256",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+        migrations.AddField(
+            model_name="preupload",
+            name="size",
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+    ]
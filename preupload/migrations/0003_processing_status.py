@@ -0,0 +1,30 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("preupload", "0002_ingest_metadata"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="preupload",
+            name="result",
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="preupload",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("ready", "Ready"),
+                    ("rejected", "Rejected"),
+                    ("error", "Error"),
+                ],
+                default="ready",
+                max_length=16,
+            ),
+        ),
+    ]
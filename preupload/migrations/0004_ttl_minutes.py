@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("preupload", "0003_processing_status"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="preupload",
+            name="ttl_minutes",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("preupload", "0004_ttl_minutes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="preupload",
+            name="lease_owner",
+            field=models.CharField(blank=True, default="", max_length=32),
+        ),
+        migrations.AddField(
+            model_name="preupload",
+            name="lease_until",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("preupload", "0005_cleanup_lease"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="preupload",
+            name="storage_ref",
+            field=models.CharField(db_index=True, max_length=500),
+        ),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("preupload", "0006_storage_ref_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PreuploadDailyStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField(unique=True)),
+                ("consumed", models.PositiveBigIntegerField(default=0)),
+                ("consumed_bytes", models.PositiveBigIntegerField(default=0)),
+                ("expired", models.PositiveBigIntegerField(default=0)),
+                ("expired_bytes", models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
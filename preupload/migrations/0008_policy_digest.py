@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("preupload", "0007_daily_stats"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="preupload",
+            name="policy_digest",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+    ]
@@ -1,11 +1,24 @@
 """Model fields that use PreuploadFileField/PreuploadImageField in forms; set _preupload_name so no mixin is needed."""
 
-from django.db import models
+from django.db import models, router
 
+from . import tokens
 from .forms import PreuploadFileField, PreuploadImageField
 from .widgets import PreuploadClearableFileWidget, PreuploadFileWidget
 
 
+def _release_on_save(field, model_instance, add, pre_save):
+    """Save the file, then release the preupload it came from once the row commits."""
+    file = getattr(model_instance, field.attname)
+    uploaded = None if not file or file._committed else file._file
+    file = pre_save(model_instance, add)
+    if uploaded is not None:
+        tokens.release_uploaded_file(
+            uploaded, using=router.db_for_write(type(model_instance))
+        )
+    return file
+
+
 class PreuploadFileModelField(models.FileField):
     """FileField that uses PreuploadFileField in ModelForms (no mixin required)."""
 
@@ -15,6 +28,9 @@ class PreuploadFileModelField(models.FileField):
         field._preupload_name = self.name
         return field
 
+    def pre_save(self, model_instance, add):
+        return _release_on_save(self, model_instance, add, super().pre_save)
+
 
 class PreuploadImageModelField(models.ImageField):
     """ImageField that uses PreuploadImageField in ModelForms (no mixin required)."""
@@ -27,3 +43,6 @@ class PreuploadImageModelField(models.ImageField):
             PreuploadClearableFileWidget() if self.blank else PreuploadFileWidget()
         )
         return field
+
+    def pre_save(self, model_instance, add):
+        return _release_on_save(self, model_instance, add, super().pre_save)
@@ -1,12 +1,55 @@
+from datetime import timedelta
+
 from django.db import models
 
+from .conf import preupload_config
+
 
 class Preupload(models.Model):
     """Tracks a preuploaded file until commit or expiry (based on created_at + TTL)."""
 
+    STATUS_PENDING = "pending"
+    STATUS_READY = "ready"
+    STATUS_REJECTED = "rejected"
+    STATUS_ERROR = "error"
+    STATUS_CHOICES = (
+        (STATUS_PENDING, "Pending"),
+        (STATUS_READY, "Ready"),
+        (STATUS_REJECTED, "Rejected"),
+        (STATUS_ERROR, "Error"),
+    )
+
     token = models.CharField(
         max_length=255, unique=True, db_index=True, null=True, blank=True
     )
-    storage_ref = models.CharField(max_length=500)
+    # Indexed: duplicates share a storage_ref, and cleanup checks for remaining ones.
+    storage_ref = models.CharField(max_length=500, db_index=True)
     original_filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField(null=True, blank=True)
+    sha256 = models.CharField(max_length=64, blank=True, default="")
+    content_type = models.CharField(max_length=255, blank=True, default="")
+    status = models.CharField(
+        max_length=16, choices=STATUS_CHOICES, default=STATUS_READY
+    )
+    result = models.JSONField(null=True, blank=True)
+    ttl_minutes = models.PositiveIntegerField(null=True, blank=True)
+    policy_digest = models.CharField(max_length=64, blank=True, default="")
+    lease_owner = models.CharField(max_length=32, blank=True, default="")
+    lease_until = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def expires_at(self):
+        """created_at + ttl_minutes (from the widget's upload policy) or TTL_MINUTES."""
+        minutes = self.ttl_minutes or preupload_config["TTL_MINUTES"]
+        return self.created_at + timedelta(minutes=minutes)
+
+
+class PreuploadDailyStats(models.Model):
+    """Per-day (UTC) counts of preuploads consumed via release_preupload and removed by cleanup."""
+
+    day = models.DateField(unique=True)
+    consumed = models.PositiveBigIntegerField(default=0)
+    consumed_bytes = models.PositiveBigIntegerField(default=0)
+    expired = models.PositiveBigIntegerField(default=0)
+    expired_bytes = models.PositiveBigIntegerField(default=0)
@@ -0,0 +1,79 @@
+"""Signed per-widget upload policies: max size, allowed extensions/content types, TTL."""
+
+import hashlib
+import json
+import os
+
+from django.core import signing
+
+from .conf import preupload_config
+
+SALT = "preupload.policy"
+POLICY_KEYS = ("max_size", "extensions", "content_types", "ttl_minutes")
+
+
+def normalize_policy(policy):
+    """
+    Return a canonical policy dict: extensions lower-case with a leading dot,
+    ttl_minutes capped at TTL_MINUTES (cleanup sweeps by the global TTL).
+    """
+    unknown = set(policy) - set(POLICY_KEYS)
+    if unknown:
+        raise ValueError(
+            "Unknown upload policy key(s): %s" % ", ".join(sorted(unknown))
+        )
+    result = {}
+    if policy.get("max_size"):
+        result["max_size"] = int(policy["max_size"])
+    if policy.get("extensions"):
+        result["extensions"] = sorted(
+            "." + ext.lower().lstrip(".") for ext in policy["extensions"]
+        )
+    if policy.get("content_types"):
+        result["content_types"] = sorted(ct.lower() for ct in policy["content_types"])
+    if policy.get("ttl_minutes"):
+        result["ttl_minutes"] = min(
+            int(policy["ttl_minutes"]), preupload_config["TTL_MINUTES"]
+        )
+    return result
+
+
+def sign_policy(policy):
+    """
+    Return the signed policy string sent by preupload.js as X-Preupload-Policy.
+    Signed on every call: the signature carries a timestamp checked against POLICY_MAX_AGE.
+    """
+    return signing.dumps(normalize_policy(policy), salt=SALT)
+
+
+def policy_digest(policy):
+    """
+    SHA-256 of the normalized policy, "" for no policy. Stored on the Preupload at
+    upload time so a token only validates on fields with the same policy.
+    """
+    normalized = normalize_policy(policy or {})
+    if not normalized:
+        return ""
+    canonical = json.dumps(normalized, sort_keys=True)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def load_policy(value):
+    """Verify and decode a signed policy; raise django.core.signing.BadSignature if invalid."""
+    return signing.loads(value, salt=SALT, max_age=preupload_config["POLICY_MAX_AGE"])
+
+
+def content_type_allowed(content_type, patterns):
+    """True if content_type matches one of patterns ("image/png", "image/*")."""
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    for pattern in patterns:
+        if pattern == content_type:
+            return True
+        if pattern.endswith("/*") and content_type.startswith(pattern[:-1]):
+            return True
+    return False
+
+
+def extension_allowed(filename, extensions):
+    """True if filename's extension is in extensions (normalized, e.g. ".jpg")."""
+    return os.path.splitext(filename or "")[1].lower() in extensions
@@ -0,0 +1,128 @@
+"""Post-upload processing: run PREUPLOAD["PROCESSORS"] off the request and record the verdict on the Preupload."""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from django.core.exceptions import ValidationError
+from django.db import connections, transaction
+from django.utils.module_loading import import_string
+
+from .conf import preupload_config
+from .models import Preupload
+from .registry import registry
+from .storage import storage
+
+
+@lru_cache(maxsize=None)
+def get_processors():
+    """Return the configured processor callables: processor(preupload, file) -> dict or None."""
+    return tuple(import_string(path) for path in preupload_config["PROCESSORS"])
+
+
+def run_processors(preupload):
+    """
+    Run every processor on the stored file and save status/result on preupload.
+    A processor rejects the file by raising ValidationError; any other exception is an error.
+    """
+    result = {}
+    try:
+        f = storage.open(preupload.storage_ref)
+        try:
+            for processor in get_processors():
+                f.seek(0)
+                result.update(processor(preupload, f) or {})
+        finally:
+            f.close()
+    except ValidationError as e:
+        preupload.status = Preupload.STATUS_REJECTED
+        preupload.result = {"errors": e.messages}
+    except Exception:
+        preupload.status = Preupload.STATUS_ERROR
+        preupload.result = {"errors": ["Processing failed."]}
+    else:
+        preupload.status = Preupload.STATUS_READY
+        preupload.result = result
+    registry.update(preupload, ["status", "result"])
+    return preupload
+
+
+def process(pk):
+    """Load preupload by pk and run processors if still pending; entry point for task queues."""
+    preupload = registry.get(pk)
+    if preupload is None or preupload.status != Preupload.STATUS_PENDING:
+        return preupload
+    return run_processors(preupload)
+
+
+class SyncBackend:
+    """Process inside the upload request (no worker)."""
+
+    def submit(self, preupload):
+        run_processors(preupload)
+
+
+class ThreadPoolBackend:
+    """
+    Process in a local thread pool once the upload's transaction commits.
+    OPTIONS: WORKERS (default 2).
+    For a task queue, write a backend whose submit() enqueues a task calling process(pk).
+    """
+
+    def __init__(self, WORKERS=2):
+        self._executor = ThreadPoolExecutor(
+            max_workers=WORKERS, thread_name_prefix="preupload"
+        )
+
+    def _run(self, pk):
+        try:
+            process(pk)
+        finally:
+            connections.close_all()
+
+    def submit(self, preupload):
+        pk = preupload.pk
+        transaction.on_commit(
+            lambda: self._executor.submit(self._run, pk),
+            using=preupload_config["DATABASE"],
+        )
+
+
+def get_processing_backend():
+    """Return the configured processing backend."""
+    cfg = preupload_config["PROCESSING"]
+    backend_class = import_string(cfg["BACKEND"])
+    opts = cfg.get("OPTIONS") or {}
+    return backend_class(**opts)
+
+
+@lru_cache(maxsize=None)
+def _backend():
+    return get_processing_backend()
+
+
+def submit(preupload):
+    """Queue processing for a newly stored preupload (status must be pending)."""
+    _backend().submit(preupload)
+
+
+def wait_for_verdict(preupload, timeout=None):
+    """
+    Return preupload once it is no longer pending, re-reading it from the registry
+    with backoff for up to timeout seconds (default PROCESSING["TIMEOUT"]); may still be pending.
+    """
+    if timeout is None:
+        timeout = preupload_config["PROCESSING"].get("TIMEOUT", 10)
+    deadline = time.monotonic() + timeout
+    delay = 0.05
+    while preupload.status == Preupload.STATUS_PENDING:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, 0.5)
+        fresh = registry.get(preupload.pk)
+        if fresh is None:
+            break
+        preupload = fresh
+    return preupload
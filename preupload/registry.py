@@ -0,0 +1,318 @@
+"""Preupload registry: where Preupload records live (ORM, Django cache, or in-process memory)."""
+
+import itertools
+import secrets
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.core.cache import caches
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .conf import preupload_config
+from .models import Preupload
+
+# Copied onto duplicates; the file, its metadata, verdict and expiry are shared.
+SHARED_FIELDS = (
+    "storage_ref",
+    "original_filename",
+    "size",
+    "sha256",
+    "content_type",
+    "status",
+    "result",
+    "ttl_minutes",
+    "policy_digest",
+)
+
+
+class BaseRegistry:
+    """
+    Stores Preupload records by pk. Records are Preupload instances; non-ORM registries
+    never save them to the database.
+    expires_records: True if the backend drops expired records itself (no cleanup sweep).
+    """
+
+    expires_records = False
+
+    def create(self, **fields):
+        """Store a new record; return it with pk and created_at set."""
+        raise NotImplementedError
+
+    def set_token(self, record, token):
+        """Persist token on an existing record."""
+        record.token = token
+        self.update(record, ["token"])
+
+    def update(self, record, fields):
+        """Persist the given field names of an existing record."""
+        raise NotImplementedError
+
+    def duplicate(self, record):
+        """
+        Store a new record pointing at record's file, with the same created_at and
+        TTL (so it expires together with record); the file is not copied.
+        """
+        raise NotImplementedError
+
+    def live_refs(self, storage_refs):
+        """Return the subset of storage_refs that some record still points at."""
+        raise NotImplementedError
+
+    def get(self, pk):
+        """Return record by pk, or None."""
+        raise NotImplementedError
+
+    def expired(self, cutoff):
+        """Iterate records created before cutoff."""
+        raise NotImplementedError
+
+    @contextmanager
+    def claim_expired(self, cutoff, limit, exclude=()):
+        """
+        Yield up to limit expired records (pks not in exclude, e.g. records put back
+        after a failed file delete earlier in the pass) that no other cleanup worker
+        holds until the block exits. Default: no coordination (single process).
+        """
+        exclude = set(exclude)
+        records = (r for r in self.expired(cutoff) if r.pk not in exclude)
+        yield list(itertools.islice(records, limit))
+
+    def delete(self, record):
+        """Remove record."""
+        raise NotImplementedError
+
+    def delete_many(self, records):
+        """Remove several records; backends may do this in one round trip."""
+        for record in records:
+            self.delete(record)
+
+
+class ModelRegistry(BaseRegistry):
+    """
+    Records in the Preupload table (default), on PREUPLOAD["DATABASE"] if set
+    (otherwise wherever DATABASE_ROUTERS send the model).
+    """
+
+    def __init__(self):
+        self._db = preupload_config["DATABASE"]
+
+    def _queryset(self):
+        return Preupload.objects.using(self._db)
+
+    def create(self, **fields):
+        record = Preupload(**fields)
+        record.save(using=self._db)
+        return record
+
+    def update(self, record, fields):
+        record.save(using=self._db, update_fields=fields)
+
+    def duplicate(self, record):
+        copy = self.create(**{name: getattr(record, name) for name in SHARED_FIELDS})
+        # created_at is auto_now_add; carry the source's over so both expire together.
+        self._queryset().filter(pk=copy.pk).update(created_at=record.created_at)
+        copy.created_at = record.created_at
+        return copy
+
+    def live_refs(self, storage_refs):
+        return set(
+            self._queryset()
+            .filter(storage_ref__in=set(storage_refs))
+            .values_list("storage_ref", flat=True)
+            .distinct()
+        )
+
+    def get(self, pk):
+        return self._queryset().filter(pk=pk).first()
+
+    def expired(self, cutoff):
+        return self._queryset().filter(created_at__lt=cutoff).iterator()
+
+    @contextmanager
+    def claim_expired(self, cutoff, limit, exclude=()):
+        """
+        SELECT ... FOR UPDATE SKIP LOCKED inside a transaction where supported, so
+        concurrent workers get disjoint batches; otherwise lease rows via
+        lease_owner/lease_until for CLEANUP_LEASE_SECONDS.
+        """
+        alias = self._db or router.db_for_write(Preupload)
+        qs = (
+            Preupload.objects.using(alias)
+            .filter(created_at__lt=cutoff)
+            .exclude(pk__in=list(exclude))
+            .order_by("pk")
+        )
+        if connections[alias].features.has_select_for_update_skip_locked:
+            with transaction.atomic(using=alias):
+                yield list(qs.select_for_update(skip_locked=True)[:limit])
+        else:
+            yield self._lease(qs, limit)
+
+    def _lease(self, qs, limit):
+        now = timezone.now()
+        owner = uuid.uuid4().hex
+        free = Q(lease_until__isnull=True) | Q(lease_until__lt=now)
+        pks = list(qs.filter(free).values_list("pk", flat=True)[:limit])
+        if not pks:
+            return []
+        # The conditional UPDATE is atomic per row: racing workers cannot both win it.
+        qs.filter(free, pk__in=pks).update(
+            lease_owner=owner,
+            lease_until=now
+            + timedelta(seconds=preupload_config["CLEANUP_LEASE_SECONDS"]),
+        )
+        return list(qs.filter(pk__in=pks, lease_owner=owner))
+
+    def delete(self, record):
+        record.delete(using=self._db)
+
+    def delete_many(self, records):
+        self._queryset().filter(pk__in=[r.pk for r in records]).delete()
+
+
+class _KeyedRegistry(BaseRegistry):
+    """Shared create/update for registries keyed by a random pk."""
+
+    def create(self, **fields):
+        record = Preupload(**fields)
+        record.created_at = timezone.now()
+        return self._insert(record)
+
+    def duplicate(self, record):
+        copy = Preupload(**{name: getattr(record, name) for name in SHARED_FIELDS})
+        copy.created_at = record.created_at
+        return self._insert(copy)
+
+    def _insert(self, record):
+        while True:
+            record.pk = secrets.randbits(63) or 1
+            if self._add(record):
+                return record
+
+    def update(self, record, fields):
+        self._set(record)
+
+
+class CacheRegistry(_KeyedRegistry):
+    """
+    Records in a Django cache (e.g. Redis) with native key TTL = TTL_MINUTES.
+    OPTIONS: CACHE (alias, default "default"), KEY_PREFIX (default "preupload").
+    Expired records vanish on their own; cleanup only sweeps storage.
+    A counter per storage_ref (same TTL as its records) tracks how many records share a file.
+    """
+
+    expires_records = True
+
+    def __init__(self, CACHE="default", KEY_PREFIX="preupload"):
+        self._alias = CACHE
+        self._prefix = KEY_PREFIX
+
+    @property
+    def _cache(self):
+        return caches[self._alias]
+
+    def _key(self, pk):
+        return "%s:%s" % (self._prefix, pk)
+
+    def _timeout(self, record):
+        remaining = record.expires_at - timezone.now()
+        return max(int(remaining.total_seconds()), 1)
+
+    def _ref_key(self, storage_ref):
+        return "%s:ref:%s" % (self._prefix, storage_ref)
+
+    def _add(self, record):
+        timeout = self._timeout(record)
+        if not self._cache.add(self._key(record.pk), record, timeout):
+            return False
+        key = self._ref_key(record.storage_ref)
+        self._cache.add(key, 0, timeout)
+        try:
+            self._cache.incr(key)
+        except ValueError:
+            # Counter expired in between; it would have expired with the record anyway.
+            pass
+        return True
+
+    def _set(self, record):
+        self._cache.set(self._key(record.pk), record, self._timeout(record))
+
+    def _release(self, records):
+        for record in records:
+            try:
+                self._cache.decr(self._ref_key(record.storage_ref))
+            except ValueError:
+                pass
+
+    def get(self, pk):
+        return self._cache.get(self._key(pk))
+
+    def expired(self, cutoff):
+        return iter(())
+
+    def live_refs(self, storage_refs):
+        keys = {self._ref_key(ref): ref for ref in storage_refs}
+        counts = self._cache.get_many(list(keys))
+        return {keys[key] for key, n in counts.items() if n > 0}
+
+    def delete(self, record):
+        self._cache.delete(self._key(record.pk))
+        self._release([record])
+
+    def delete_many(self, records):
+        self._cache.delete_many([self._key(r.pk) for r in records])
+        self._release(records)
+
+
+class MemoryRegistry(_KeyedRegistry):
+    """Records in a process-local dict; for tests and single-process development."""
+
+    def __init__(self):
+        self._records = {}
+        self._lock = threading.Lock()
+
+    def _add(self, record):
+        with self._lock:
+            if record.pk in self._records:
+                return False
+            self._records[record.pk] = record
+            return True
+
+    def _set(self, record):
+        with self._lock:
+            self._records[record.pk] = record
+
+    def get(self, pk):
+        return self._records.get(pk)
+
+    def expired(self, cutoff):
+        with self._lock:
+            records = [r for r in self._records.values() if r.created_at < cutoff]
+        return iter(records)
+
+    def live_refs(self, storage_refs):
+        refs = set(storage_refs)
+        with self._lock:
+            return {
+                r.storage_ref for r in self._records.values() if r.storage_ref in refs
+            }
+
+    def delete(self, record):
+        with self._lock:
+            self._records.pop(record.pk, None)
+
+
+def get_registry():
+    """Return the configured preupload registry backend."""
+    cfg = preupload_config["REGISTRY"]
+    registry_class = import_string(cfg["BACKEND"])
+    opts = cfg.get("OPTIONS") or {}
+    return registry_class(**opts)
+
+
+registry = get_registry()
@@ -0,0 +1,29 @@
+"""PreuploadRouter: keep the Preupload table on PREUPLOAD["DATABASE"]."""
+
+from .conf import preupload_config
+
+APP_LABEL = "preupload"
+
+
+class PreuploadRouter:
+    """
+    Route reads, writes and migrations of the preupload app to PREUPLOAD["DATABASE"].
+    Add "preupload.routers.PreuploadRouter" to DATABASE_ROUTERS. No-op if DATABASE is unset.
+    """
+
+    def _db(self, model):
+        if model._meta.app_label == APP_LABEL:
+            return preupload_config["DATABASE"]
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._db(model)
+
+    def db_for_write(self, model, **hints):
+        return self._db(model)
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        alias = preupload_config["DATABASE"]
+        if alias is None or app_label != APP_LABEL:
+            return None
+        return db == alias
@@ -0,0 +1,372 @@
+/**
+ * Preupload client controller (ES module): preupload file on change, block submit while uploading.
+ * One delegated change/submit listener per root (the document by default); widget state is
+ * created on first interaction, and [data-preupload] elements added later (e.g. admin
+ * "Add another" rows) are picked up by a MutationObserver.
+ * Tokens are kept in sessionStorage per form and field and revalidated via the status
+ * endpoint after a reload, so files are not uploaded twice.
+ *
+ *     import { start } from "/static/preupload/js/preupload.esm.min.js";
+ *     start();
+ *
+ * preupload.esm.min.js is built from this file (scripts/build_static.py).
+ */
+
+export const STATES = { idle: "idle", uploading: "uploading", ready: "ready", error: "error" };
+
+const WIDGET_SELECTOR = "[data-preupload]";
+const widgets = new WeakMap();
+const startedRoots = new WeakSet();
+const handledEvents = new WeakSet();
+
+function getFormConfig(form) {
+    const w = form && form.querySelector(WIDGET_SELECTOR);
+    if (w) {
+        const preuploadUrl = w.getAttribute("data-preupload-url");
+        const csrfToken = w.getAttribute("data-preupload-csrf-token");
+        const statusUrl = w.getAttribute("data-preupload-status-url");
+        if (preuploadUrl) return { preuploadUrl, csrfToken, statusUrl };
+    }
+    if (form) {
+        const preuploadUrl = form.getAttribute("data-preupload-url");
+        const csrfToken = form.getAttribute("data-preupload-csrf-token");
+        const statusUrl = form.getAttribute("data-preupload-status-url");
+        if (preuploadUrl && csrfToken !== null) return { preuploadUrl, csrfToken, statusUrl };
+    }
+    const el = document.getElementById("preupload-config");
+    if (el && el.textContent) {
+        try {
+            const c = JSON.parse(el.textContent);
+            return {
+                preuploadUrl: c.preuploadUrl || c.preupload_url,
+                csrfToken: c.csrfToken || c.csrf_token,
+                statusUrl: c.statusUrl || c.status_url
+            };
+        } catch (e) {}
+    }
+    return null;
+}
+
+const tokenStore = {
+    key(form, tokenInput) {
+        let formKey = form.id || form.getAttribute("action") || "";
+        if (!formKey) formKey = "#" + Array.prototype.indexOf.call(document.forms, form);
+        return "preupload:" + window.location.pathname + ":" + formKey + ":" + tokenInput.name;
+    },
+    get(key) {
+        try {
+            return window.sessionStorage.getItem(key);
+        } catch (e) {
+            return null;
+        }
+    },
+    set(key, token) {
+        try {
+            window.sessionStorage.setItem(key, token);
+        } catch (e) {}
+    },
+    remove(key) {
+        try {
+            window.sessionStorage.removeItem(key);
+        } catch (e) {}
+    }
+};
+
+function getCsrfFromCookie() {
+    for (const cookie of document.cookie.split(";")) {
+        const parts = cookie.trim().split("=");
+        if (parts[0] === "csrftoken") return parts[1] ? decodeURIComponent(parts[1].trim()) : "";
+    }
+    return "";
+}
+
+/**
+ * Read the widget's signed upload policy. The value is Django's signing format
+ * ("<base64url JSON>:<timestamp>:<signature>"); the server verifies it, the
+ * client only reads the limits to reject files before sending any bytes.
+ */
+function readPolicy(el) {
+    const signed = el.getAttribute("data-preupload-policy");
+    if (!signed) return null;
+    try {
+        let b64 = signed.split(":")[0].replace(/-/g, "+").replace(/_/g, "/");
+        while (b64.length % 4) b64 += "=";
+        return { signed, rules: JSON.parse(window.atob(b64)) };
+    } catch (e) {
+        return { signed, rules: {} };
+    }
+}
+
+function contentTypeAllowed(type, patterns) {
+    type = (type || "").toLowerCase();
+    return patterns.some(
+        (p) => p === type || (p.slice(-2) === "/*" && type.indexOf(p.slice(0, -1)) === 0)
+    );
+}
+
+function policyViolation(file, rules) {
+    if (rules.max_size && file.size > rules.max_size) return "size";
+    if (rules.extensions) {
+        const dot = file.name.lastIndexOf(".");
+        const ext = dot === -1 ? "" : file.name.slice(dot).toLowerCase();
+        if (rules.extensions.indexOf(ext) === -1) return "extension";
+    }
+    if (rules.content_types && !contentTypeAllowed(file.type, rules.content_types)) return "content-type";
+    return null;
+}
+
+function tokenInputOf(el) {
+    return el.querySelector('input[type="hidden"]');
+}
+
+function storeKeyOf(el) {
+    // Computed on use: formset scripts rename inputs (__prefix__ -> index) after cloning.
+    const form = el.closest("form");
+    const tokenInput = tokenInputOf(el);
+    return form && tokenInput ? tokenStore.key(form, tokenInput) : null;
+}
+
+class PreuploadWidget {
+    constructor(el) {
+        this.el = el;
+        this.fileInput = el.querySelector('input[type="file"]');
+        this.tokenInput = tokenInputOf(el);
+        this.state = el.getAttribute("data-preupload-state") || STATES.idle;
+        this.policy = readPolicy(el);
+    }
+
+    get form() {
+        return this.el.closest("form");
+    }
+
+    get storeKey() {
+        return storeKeyOf(this.el);
+    }
+
+    restore(token) {
+        const config = getFormConfig(this.form);
+        if (!config || !config.statusUrl) return;
+        const xhr = new XMLHttpRequest();
+        xhr.addEventListener("load", () => {
+            if (xhr.status === 404) {
+                tokenStore.remove(this.storeKey);
+                return;
+            }
+            if (xhr.status < 200 || xhr.status >= 300) return;
+            if (this.state !== STATES.idle || this.tokenInput.value) return;
+            let data;
+            try {
+                data = JSON.parse(xhr.responseText);
+            } catch (err) {
+                return;
+            }
+            this.tokenInput.value = token;
+            if (data.original_filename) this.el.setAttribute("data-preupload-filename", data.original_filename);
+            this.setState(STATES.ready);
+            this.dispatch("preupload:restored", { detail: data });
+        });
+        const sep = config.statusUrl.indexOf("?") === -1 ? "?" : "&";
+        xhr.open("GET", config.statusUrl + sep + "token=" + encodeURIComponent(token));
+        xhr.setRequestHeader("X-Requested-With", "XMLHttpRequest");
+        xhr.send();
+    }
+
+    onFileChange() {
+        const file = this.fileInput.files && this.fileInput.files[0];
+        if (!file) {
+            this.setState(STATES.idle);
+            this.clearToken();
+            return;
+        }
+        this.upload(file);
+    }
+
+    clearToken() {
+        if (this.tokenInput) this.tokenInput.value = "";
+        const key = this.storeKey;
+        if (key) tokenStore.remove(key);
+    }
+
+    upload(file) {
+        const config = getFormConfig(this.form);
+        if (!config || !config.preuploadUrl) {
+            this.setState(STATES.error);
+            this.dispatch("preupload:error", { detail: { reason: "no-config" } });
+            return;
+        }
+        const violation = this.policy && policyViolation(file, this.policy.rules);
+        if (violation) {
+            this.setState(STATES.error);
+            this.clearToken();
+            this.dispatch("preupload:error", { detail: { reason: "policy", violation, policy: this.policy.rules } });
+            return;
+        }
+        const xhr = new XMLHttpRequest();
+        const formData = new FormData();
+        formData.append("file", file);
+        const csrf = (config.csrfToken !== undefined && config.csrfToken !== null && config.csrfToken !== "")
+            ? config.csrfToken
+            : getCsrfFromCookie();
+        if (csrf) formData.append("csrfmiddlewaretoken", csrf);
+
+        this.setState(STATES.uploading);
+        this.dispatch("preupload:start", { detail: { file } });
+
+        xhr.upload.addEventListener("progress", (e) => {
+            if (e.lengthComputable) {
+                this.dispatch("preupload:progress", { detail: { loaded: e.loaded, total: e.total } });
+            }
+        });
+        xhr.addEventListener("load", () => {
+            if (xhr.status >= 200 && xhr.status < 300) {
+                try {
+                    const data = JSON.parse(xhr.responseText);
+                    if (data.token && this.tokenInput) {
+                        this.tokenInput.value = data.token;
+                        const key = this.storeKey;
+                        if (key) tokenStore.set(key, data.token);
+                    }
+                    this.setState(STATES.ready);
+                    this.dispatch("preupload:complete", { detail: data });
+                } catch (err) {
+                    this.setState(STATES.error);
+                    this.dispatch("preupload:error", { detail: { reason: "parse", xhr } });
+                }
+            } else {
+                this.setState(STATES.error);
+                this.dispatch("preupload:error", { detail: { reason: "http", status: xhr.status, xhr } });
+                this.clearToken();
+            }
+        });
+        xhr.addEventListener("error", () => {
+            this.setState(STATES.error);
+            this.dispatch("preupload:error", { detail: { reason: "network" } });
+            this.clearToken();
+        });
+        xhr.open("POST", config.preuploadUrl);
+        xhr.setRequestHeader("X-Requested-With", "XMLHttpRequest");
+        if (this.policy) xhr.setRequestHeader("X-Preupload-Policy", this.policy.signed);
+        xhr.send(formData);
+    }
+
+    setState(s) {
+        this.state = s;
+        this.el.setAttribute("data-preupload-state", s);
+    }
+
+    dispatch(type, opts) {
+        this.el.dispatchEvent(new CustomEvent(type, opts || { bubbles: true }));
+    }
+}
+
+/** Return the controller state for a [data-preupload] element, creating it on first use. */
+export function getWidget(el) {
+    let widget = widgets.get(el);
+    if (!widget) {
+        widget = new PreuploadWidget(el);
+        widgets.set(el, widget);
+    }
+    return widget;
+}
+
+/**
+ * Cheap pass over widgets in node (no listeners, no state unless needed): upload
+ * files chosen before the controller started, keep server-rendered tokens across
+ * reloads and restore stored ones.
+ */
+function scan(node) {
+    const found = node.matches(WIDGET_SELECTOR) ? [node] : node.querySelectorAll(WIDGET_SELECTOR);
+    for (const el of found) {
+        const fileInput = el.querySelector('input[type="file"]');
+        if (fileInput && fileInput.files && fileInput.files.length) {
+            // Picked while the module was still loading: its change event was missed.
+            const widget = getWidget(el);
+            if (widget.state === STATES.idle) widget.onFileChange();
+            continue;
+        }
+        const tokenInput = tokenInputOf(el);
+        const key = storeKeyOf(el);
+        if (!key) continue;
+        if (tokenInput.value) {
+            // Server re-rendered the token (e.g. validation error).
+            tokenStore.set(key, tokenInput.value);
+            continue;
+        }
+        const token = tokenStore.get(key);
+        if (token) getWidget(el).restore(token);
+    }
+}
+
+function firstSeen(e) {
+    // Nested started roots see the same event; only the first one acts on it.
+    if (handledEvents.has(e)) return false;
+    handledEvents.add(e);
+    return true;
+}
+
+function onChange(e) {
+    if (!firstSeen(e)) return;
+    const input = e.target;
+    if (!(input instanceof HTMLInputElement) || input.type !== "file") return;
+    const el = input.closest(WIDGET_SELECTOR);
+    if (el) getWidget(el).onFileChange();
+}
+
+function onSubmit(e) {
+    if (!firstSeen(e)) return;
+    const form = e.target;
+    if (!(form instanceof HTMLFormElement)) return;
+    const els = form.querySelectorAll(WIDGET_SELECTOR);
+    if (!els.length) return;
+    if (form.querySelector(WIDGET_SELECTOR + '[data-preupload-state="uploading"]')) {
+        e.preventDefault();
+        const warn = typeof window.preuploadWarn === "function"
+            ? window.preuploadWarn
+            : () => window.alert("Please wait for the upload to finish.");
+        warn({ form, widgets: Array.from(els, getWidget) });
+        return;
+    }
+    // Submitted: a re-rendered form carries its tokens in the HTML again.
+    for (const el of els) {
+        const key = storeKeyOf(el);
+        if (key) tokenStore.remove(key);
+    }
+}
+
+function observe(root) {
+    const observer = new MutationObserver((records) => {
+        for (const record of records) {
+            for (const node of record.addedNodes) {
+                if (node.nodeType === Node.ELEMENT_NODE) scan(node);
+            }
+        }
+    });
+    observer.observe(root, { childList: true, subtree: true });
+}
+
+/**
+ * Start the controller on root (default: document or a container such as a form).
+ * Idempotent, and safe to call for roots nested in an already started one.
+ */
+export function start(root = document) {
+    if (startedRoots.has(root)) return;
+    startedRoots.add(root);
+    root.addEventListener("change", onChange);
+    // Capture, so an upload in progress blocks submit before other handlers run.
+    root.addEventListener("submit", onSubmit, true);
+    const ready = () => {
+        scan(root === document ? document.documentElement : root);
+        observe(root);
+    };
+    if (document.readyState === "loading") {
+        document.addEventListener("DOMContentLoaded", ready);
+    } else {
+        ready();
+    }
+}
+
+/** Backwards-compatible entry point: start on the document and return form's widgets. */
+export function attachForm(form) {
+    start(document);
+    return Array.from(form.querySelectorAll(WIDGET_SELECTOR), getWidget);
+}
@@ -0,0 +1,149 @@
+"""Outcome counters and aggregate queries behind the preupload_stats command."""
+
+import random
+from datetime import timedelta
+
+from django.db import IntegrityError, router, transaction
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.utils import timezone
+
+from .conf import preupload_config
+from .models import Preupload, PreuploadDailyStats
+
+OUTCOMES = ("consumed", "expired")
+
+
+def _alias(model):
+    return preupload_config["DATABASE"] or router.db_for_write(model)
+
+
+def record_outcome(outcome, count, nbytes=0):
+    """
+    Add count preuploads (nbytes total) to today's "consumed" or "expired" counter.
+    One UPDATE per call; no-op if PREUPLOAD["STATS"] is off.
+    """
+    if outcome not in OUTCOMES:
+        raise ValueError("Unknown preupload outcome %r." % outcome)
+    if not preupload_config["STATS"] or not count:
+        return
+    alias = _alias(PreuploadDailyStats)
+    today = timezone.now().date()
+    qs = PreuploadDailyStats.objects.using(alias).filter(day=today)
+    changes = {
+        outcome: F(outcome) + count,
+        outcome + "_bytes": F(outcome + "_bytes") + nbytes,
+    }
+    if qs.update(**changes):
+        return
+    try:
+        with transaction.atomic(using=alias):
+            PreuploadDailyStats.objects.using(alias).create(
+                day=today, **{outcome: count, outcome + "_bytes": nbytes}
+            )
+    except IntegrityError:
+        # Another process created today's row first.
+        qs.update(**changes)
+
+
+def outstanding(now, bins):
+    """
+    Aggregate the Preupload table in one query: count, bytes, oldest, records past
+    TTL_MINUTES (awaiting cleanup) and an age histogram with edges bins (minutes).
+    """
+    qs = Preupload.objects.using(_alias(Preupload))
+    cutoff = now - timedelta(minutes=preupload_config["TTL_MINUTES"])
+    aggregates = {
+        "count": Count("pk"),
+        "bytes": Sum("size"),
+        "unknown_size": Count("pk", filter=Q(size__isnull=True)),
+        "oldest": Min("created_at"),
+        "expired": Count("pk", filter=Q(created_at__lt=cutoff)),
+        "expired_bytes": Sum("size", filter=Q(created_at__lt=cutoff)),
+    }
+    edges = sorted(set(bins))
+    labels = []
+    for i, edge in enumerate(edges):
+        age = Q(created_at__gte=now - timedelta(minutes=edge))
+        if i:
+            age &= Q(created_at__lt=now - timedelta(minutes=edges[i - 1]))
+            label = "%d-%dm" % (edges[i - 1], edge)
+        else:
+            label = "<%dm" % edge
+        aggregates["age:" + label] = Count("pk", filter=age)
+        labels.append(label)
+    if edges:
+        label = ">=%dm" % edges[-1]
+        older = Q(created_at__lt=now - timedelta(minutes=edges[-1]))
+        aggregates["age:" + label] = Count("pk", filter=older)
+        labels.append(label)
+    row = qs.aggregate(**aggregates)
+    oldest = row.pop("oldest")
+    result = {key: row[key] or 0 for key in row if not key.startswith("age:")}
+    result["oldest_age_seconds"] = (
+        int((now - oldest).total_seconds()) if oldest is not None else None
+    )
+    result["age_histogram"] = {label: row["age:" + label] for label in labels}
+    result["by_status"] = {
+        item["status"]: {"count": item["count"], "bytes": item["bytes"] or 0}
+        for item in qs.values("status")
+        .annotate(count=Count("pk"), bytes=Sum("size"))
+        .order_by("status")
+    }
+    return result
+
+
+def outcomes(days, now):
+    """Sum the daily consumed/expired counters over the last days days (today included)."""
+    since = now.date() - timedelta(days=days - 1)
+    row = (
+        PreuploadDailyStats.objects.using(_alias(PreuploadDailyStats))
+        .filter(day__gte=since)
+        .aggregate(
+            consumed=Sum("consumed"),
+            consumed_bytes=Sum("consumed_bytes"),
+            expired=Sum("expired"),
+            expired_bytes=Sum("expired_bytes"),
+        )
+    )
+    result = {key: value or 0 for key, value in row.items()}
+    total = result["consumed"] + result["expired"]
+    result["days"] = days
+    result["expired_ratio"] = round(result["expired"] / total, 4) if total else None
+    return result
+
+
+def sample_storage(storage, n, rng=None):
+    """
+    Compare recorded sizes with storage.size() for about n random preuploads, picked by
+    index seeks on random pks (no ORDER BY RANDOM()). Returns sampled/missing counts and
+    the mean real and recorded size.
+    """
+    rng = rng or random.Random()
+    qs = Preupload.objects.using(_alias(Preupload)).order_by("pk")
+    bounds = qs.aggregate(low=Min("pk"), high=Max("pk"))
+    seen = {}
+    if bounds["low"] is not None:
+        for _ in range(n):
+            pk = rng.randint(bounds["low"], bounds["high"])
+            row = qs.filter(pk__gte=pk).values_list("pk", "storage_ref", "size").first()
+            if row is not None:
+                seen[row[0]] = row[1:]
+    real, recorded, missing = [], [], 0
+    for storage_ref, size in seen.values():
+        try:
+            real.append(storage.size(storage_ref))
+        except (FileNotFoundError, OSError):
+            missing += 1
+            continue
+        if size is not None:
+            recorded.append(size)
+
+    def mean(values):
+        return round(sum(values) / len(values), 1) if values else None
+
+    return {
+        "sampled": len(seen),
+        "missing": missing,
+        "mean_size": mean(real),
+        "mean_recorded_size": mean(recorded),
+    }
@@ -1,40 +1,434 @@
 """Preupload storage layer: save/open/delete preuploaded files via Django Storage abstraction."""
 
+import hashlib
+import math
+import os
+import shutil
+import threading
+import time
 import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone as dt_timezone
 
+from django.core.cache import caches
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.utils import timezone
 from django.utils.module_loading import import_string
 
 from .conf import preupload_config
+from .ingest import IngestReader, IngestResult
 
 PREFIX = "preupload/"
 
+# KEY_LAYOUT -> (strftime format of the bucket segments, bucket span); buckets are UTC.
+KEY_LAYOUTS = {
+    "flat": None,
+    "day": ("%Y/%m/%d", timedelta(days=1)),
+    "hour": ("%Y/%m/%d/%H", timedelta(hours=1)),
+}
 
-def get_preupload_storage():
-    """Return the configured preupload storage backend."""
-    cfg = preupload_config["STORAGE"]
+
+def _build_storage(cfg):
     storage_class = import_string(cfg["BACKEND"])
     opts = cfg.get("OPTIONS") or {}
     return storage_class(**opts)
 
 
+def get_preupload_storages():
+    """
+    Return [(name, storage, weight)] for PREUPLOAD["STORAGE"], which is one storage
+    config or a list of them (striping). A shard's name is its NAME or list index.
+    """
+    cfg = preupload_config["STORAGE"]
+    configs = cfg if isinstance(cfg, (list, tuple)) else [cfg]
+    if not configs:
+        raise ValueError("PREUPLOAD STORAGE must not be empty.")
+    shards = []
+    for index, shard_cfg in enumerate(configs):
+        name = str(shard_cfg.get("NAME", index))
+        if not name or ":" in name or "/" in name:
+            raise ValueError("Invalid PREUPLOAD storage NAME %r." % name)
+        shards.append((name, _build_storage(shard_cfg), shard_cfg.get("WEIGHT", 1)))
+    if len({name for name, _, _ in shards}) != len(shards):
+        raise ValueError("PREUPLOAD storage NAMEs must be unique.")
+    return shards
+
+
+def get_preupload_storage():
+    """Return the configured preupload storage backend (the first one when striping)."""
+    return get_preupload_storages()[0][1]
+
+
+def _rendezvous_score(shard, key, weight):
+    """Weighted rendezvous (highest random weight) hashing score of key on shard."""
+    digest = hashlib.blake2b((shard + ":" + key).encode(), digest_size=8).digest()
+    unit = (int.from_bytes(digest, "big") + 1) / 2.0**64
+    return weight / -math.log(unit) if unit < 1 else math.inf
+
+
+class LocalHotCache:
+    """
+    Bounded in-process LRU of small preuploaded files; evicts least recently used
+    entries beyond MAX_BYTES. OPTIONS: MAX_BYTES (default 32 MiB).
+    """
+
+    def __init__(self, MAX_BYTES=32 * 1024 * 1024):
+        self._max_bytes = MAX_BYTES
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _pop(self, storage_ref):
+        entry = self._entries.pop(storage_ref, None)
+        if entry is not None:
+            self._bytes -= len(entry[0])
+
+    def get(self, storage_ref):
+        with self._lock:
+            entry = self._entries.get(storage_ref)
+            if entry is None:
+                return None
+            if entry[1] < time.monotonic():
+                self._pop(storage_ref)
+                return None
+            self._entries.move_to_end(storage_ref)
+            return entry[0]
+
+    def set(self, storage_ref, data, timeout):
+        if len(data) > self._max_bytes:
+            return
+        with self._lock:
+            self._pop(storage_ref)
+            self._entries[storage_ref] = (data, time.monotonic() + timeout)
+            self._bytes += len(data)
+            while self._bytes > self._max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def delete(self, storage_ref):
+        with self._lock:
+            self._pop(storage_ref)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for storage_ref in [r for r in self._entries if r.startswith(prefix)]:
+                self._pop(storage_ref)
+
+
+class DjangoCacheHotCache:
+    """
+    Small preuploaded files in a Django cache shared by all processes.
+    OPTIONS: CACHE (alias, default "default"), KEY_PREFIX (default "preupload:blob").
+    """
+
+    def __init__(self, CACHE="default", KEY_PREFIX="preupload:blob"):
+        self._alias = CACHE
+        self._prefix = KEY_PREFIX
+
+    @property
+    def _cache(self):
+        return caches[self._alias]
+
+    def _key(self, storage_ref):
+        return "%s:%s" % (self._prefix, storage_ref)
+
+    def get(self, storage_ref):
+        return self._cache.get(self._key(storage_ref))
+
+    def set(self, storage_ref, data, timeout):
+        self._cache.set(self._key(storage_ref), data, timeout)
+
+    def delete(self, storage_ref):
+        self._cache.delete(self._key(storage_ref))
+
+    def delete_prefix(self, prefix):
+        # Entries expire with TTL_MINUTES, before their bucket can be dropped.
+        pass
+
+
+def get_hot_cache():
+    """Return the configured small-file cache, or None if HOT_CACHE is unset."""
+    cfg = preupload_config["HOT_CACHE"]
+    if not cfg:
+        return None
+    cache_class = import_string(cfg["BACKEND"])
+    opts = cfg.get("OPTIONS") or {}
+    return cache_class(**opts)
+
+
 class PreuploadStorage:
-    """Wraps Django Storage for preuploaded files; exposes only storage_ref strings."""
+    """
+    Wraps Django Storage for preuploaded files; exposes only storage_ref strings.
+    With several backends (striping) new files are spread by STRIPING and the
+    storage_ref is "<shard>:<key>", so reads and deletes go straight to the shard.
+    """
 
     def __init__(self):
-        self._storage = get_preupload_storage()
+        shards = get_preupload_storages()
+        self._shards = {name: storage for name, storage, _ in shards}
+        self._weights = [(name, weight) for name, _, weight in shards]
+        self._storage = shards[0][1]
+        self._striped = len(shards) > 1
+        self._striping = preupload_config["STRIPING"]
+        if self._striping not in ("hash", "free_space"):
+            raise ValueError("Unknown PREUPLOAD STRIPING %r." % self._striping)
+        layout = preupload_config["KEY_LAYOUT"]
+        if layout not in KEY_LAYOUTS:
+            raise ValueError("Unknown PREUPLOAD KEY_LAYOUT %r." % layout)
+        self._layout = KEY_LAYOUTS[layout]
+        self._shard_depth = preupload_config["KEY_SHARD_DEPTH"]
+        self._hot_cache = get_hot_cache()
+        if self._hot_cache is not None:
+            self._hot_max_size = preupload_config["HOT_CACHE"].get(
+                "MAX_FILE_SIZE", 256 * 1024
+            )
+
+    def _new_ref(self):
+        """PREFIX + [time bucket/] + [hash shards/] + uuid hex."""
+        name = uuid.uuid4().hex
+        parts = [name[2 * i : 2 * i + 2] for i in range(self._shard_depth)]
+        if self._layout:
+            bucket = datetime.now(dt_timezone.utc).strftime(self._layout[0])
+            parts.insert(0, bucket)
+        return PREFIX + "".join(part + "/" for part in parts) + name
+
+    def _bucket_start(self, bucket):
+        """Parse a bucket path (without PREFIX) to its UTC start, or None."""
+        try:
+            start = datetime.strptime(bucket, self._layout[0])
+        except ValueError:
+            return None
+        return start.replace(tzinfo=dt_timezone.utc)
+
+    def _bucket_expired(self, start, cutoff):
+        # One span of grace: a key's bucket is read before the (possibly slow) backend
+        # write, its record's created_at after it, so the record may be a span younger.
+        return start + 2 * self._layout[1] <= cutoff
+
+    def split_ref(self, storage_ref):
+        """Return (shard name or None, backend key) for storage_ref."""
+        shard, sep, key = storage_ref.partition(":")
+        if sep and shard in self._shards:
+            return shard, key
+        return None, storage_ref
+
+    def _route(self, storage_ref):
+        """Return (backend, key) for storage_ref; refs without a shard use the first backend."""
+        shard, key = self.split_ref(storage_ref)
+        return self._shards.get(shard, self._storage), key
+
+    def _encode(self, shard, key):
+        return "%s:%s" % (shard, key) if self._striped else key
+
+    def _shard_weight(self, shard, weight):
+        if self._striping == "free_space":
+            try:
+                return shutil.disk_usage(self._shards[shard].path("")).free
+            except (NotImplementedError, OSError):
+                return 0
+        return weight
+
+    def _pick_shard(self, key):
+        """
+        Choose the shard for a new key by weighted rendezvous hashing: WEIGHT for
+        "hash", free bytes on the volume for "free_space" (local backends only).
+        """
+        if not self._striped:
+            return next(iter(self._shards))
+        weights = [(name, self._shard_weight(name, w)) for name, w in self._weights]
+        if not any(w for _, w in weights):
+            weights = [(name, 1) for name, _ in weights]
+        best = max(weights, key=lambda item: _rendezvous_score(item[0], key, item[1]))
+        return best[0]
+
+    @staticmethod
+    def _aware(cutoff):
+        return timezone.make_aware(cutoff) if timezone.is_naive(cutoff) else cutoff
+
+    @staticmethod
+    def _listdir(backend, path):
+        try:
+            return backend.listdir(path)
+        except FileNotFoundError:
+            return [], []
 
     def save(self, file, name=None):
         """Save file; return opaque storage_ref (no user input in path)."""
-        ref = PREFIX + uuid.uuid4().hex
-        return self._storage.save(ref, file)
+        return self.ingest(file, name=name).storage_ref
+
+    def ingest(self, file, name=None):
+        """Save file, computing size, SHA-256 and content type in the same pass; return IngestResult."""
+        ref = self._new_ref()
+        shard = self._pick_shard(ref)
+        backend = self._shards[shard]
+        try:
+            file.seek(0)
+        except (AttributeError, OSError):
+            pass
+        if hasattr(file, "temporary_file_path"):
+            key, size, sha256, content_type = self._ingest_temporary(backend, file, ref)
+        else:
+            reader = IngestReader(file)
+            key = backend.save(ref, File(reader, name=ref))
+            size, sha256, content_type = reader.finish()
+            if self._hot_cache is not None and size <= self._hot_max_size:
+                self._remember(self._encode(shard, key), file)
+        return IngestResult(self._encode(shard, key), size, sha256, content_type)
+
+    def _ingest_temporary(self, backend, file, ref):
+        """
+        Ingest an upload Django already spooled to disk without writing it again:
+        digest it with one local read, then hand over the path. Backends with
+        save_from_path(name, path) use it; otherwise the file itself is passed, which
+        FileSystemStorage renames into place (copying only across devices).
+        """
+        size, sha256, content_type = IngestReader(file).finish()
+        file.seek(0)
+        if hasattr(backend, "save_from_path"):
+            key = backend.save_from_path(ref, file.temporary_file_path())
+        else:
+            key = backend.save(ref, file)
+        return key, size, sha256, content_type
+
+    def _remember(self, storage_ref, file):
+        """Copy a small in-memory upload into HOT_CACHE so re-validation skips the backend."""
+        try:
+            file.seek(0)
+            data = file.read()
+        except (ValueError, OSError):
+            # The backend closed the upload after saving it.
+            return
+        self._hot_cache.set(storage_ref, data, preupload_config["TTL_MINUTES"] * 60)
+
+    def _cached(self, storage_ref):
+        if self._hot_cache is None:
+            return None
+        return self._hot_cache.get(storage_ref)
 
     def open(self, storage_ref):
-        """Open preuploaded file by storage_ref; return file-like."""
-        return self._storage.open(storage_ref, mode="rb")
+        """
+        Open preuploaded file by storage_ref; return file-like (from HOT_CACHE if held
+        there). Small files read from the backend are added to HOT_CACHE on the way, so
+        other processes than the one that took the upload hit the backend only once.
+        """
+        data = self._cached(storage_ref)
+        if data is not None:
+            return ContentFile(data, name=storage_ref)
+        backend, key = self._route(storage_ref)
+        f = backend.open(key, mode="rb")
+        if self._hot_cache is None or f.size > self._hot_max_size:
+            return f
+        with f:
+            data = f.read()
+        self._hot_cache.set(storage_ref, data, preupload_config["TTL_MINUTES"] * 60)
+        return ContentFile(data, name=storage_ref)
+
+    def size(self, storage_ref):
+        """Return size in bytes of the preuploaded file."""
+        data = self._cached(storage_ref)
+        if data is not None:
+            return len(data)
+        backend, key = self._route(storage_ref)
+        return backend.size(key)
+
+    def local_path(self, storage_ref):
+        """Return the filesystem path for storage_ref, or None if the backend is not local."""
+        backend, key = self._route(storage_ref)
+        try:
+            return backend.path(key)
+        except NotImplementedError:
+            return None
 
     def delete(self, storage_ref):
         """Delete preuploaded file by storage_ref."""
-        self._storage.delete(storage_ref)
+        if self._hot_cache is not None:
+            self._hot_cache.delete(storage_ref)
+        backend, key = self._route(storage_ref)
+        backend.delete(key)
+
+    def _walk(self, backend, path):
+        dirs, files = self._listdir(backend, path)
+        for name in files:
+            yield path + name
+        for name in dirs:
+            yield from self._walk(backend, path + name + "/")
+
+    def expired_refs(self, cutoff):
+        """Yield storage_refs last modified before cutoff (for registries that expire records themselves)."""
+        cutoff = self._aware(cutoff)
+        for shard, backend in self._shards.items():
+            for key in self._walk(backend, PREFIX):
+                if backend.get_modified_time(key) < cutoff:
+                    yield self._encode(shard, key)
+
+    def expired_buckets(self, cutoff):
+        """
+        Return bucket prefixes (with PREFIX, and "<shard>:" when striping) whose whole
+        time span ended at least one span before cutoff; [] for flat layout.
+        """
+        if not self._layout:
+            return []
+        cutoff = self._aware(cutoff)
+        depth = self._layout[0].count("/") + 1
+        expired = []
+        for shard, backend in self._shards.items():
+            buckets = [""]
+            for _ in range(depth):
+                buckets = [
+                    bucket + name + "/"
+                    for bucket in buckets
+                    for name in sorted(self._listdir(backend, PREFIX + bucket)[0])
+                ]
+            for bucket in buckets:
+                start = self._bucket_start(bucket.rstrip("/"))
+                if start is not None and self._bucket_expired(start, cutoff):
+                    expired.append(self._encode(shard, PREFIX + bucket))
+        return expired
+
+    def in_expired_bucket(self, storage_ref, cutoff):
+        """True if storage_ref lives in a bucket that expired_buckets(cutoff) would return."""
+        storage_ref = self.split_ref(storage_ref)[1]
+        if not self._layout or not storage_ref.startswith(PREFIX):
+            return False
+        depth = self._layout[0].count("/") + 1
+        bucket = "/".join(storage_ref[len(PREFIX) :].split("/")[:depth])
+        start = self._bucket_start(bucket)
+        return start is not None and self._bucket_expired(start, self._aware(cutoff))
+
+    def delete_bucket(self, bucket):
+        """
+        Delete a whole bucket prefix: rmtree on local filesystems, the backend's
+        delete_prefix(prefix) if it has one, batched deletes on django-storages S3,
+        else one delete per file.
+        """
+        if self._hot_cache is not None:
+            self._hot_cache.delete_prefix(bucket)
+        backend, bucket = self._route(bucket)
+        if hasattr(backend, "delete_prefix"):
+            backend.delete_prefix(bucket)
+            return
+        if hasattr(getattr(backend, "bucket", None), "objects"):
+            # boto3 bucket (S3Storage): listed and deleted 1000 keys per request.
+            prefix = backend._normalize_name(bucket)
+            backend.bucket.objects.filter(Prefix=prefix).delete()
+            return
+        try:
+            path = backend.path(bucket)
+        except NotImplementedError:
+            for key in list(self._walk(backend, bucket)):
+                backend.delete(key)
+            return
+        shutil.rmtree(path, ignore_errors=True)
+        # Drop now-empty parent directories (e.g. the day of an hour bucket).
+        parent = os.path.dirname(path.rstrip(os.sep))
+        root = backend.path(PREFIX).rstrip(os.sep)
+        while parent.startswith(root) and parent != root:
+            try:
+                os.rmdir(parent)
+            except OSError:
+                break
+            parent = os.path.dirname(parent)
 
 
 storage = PreuploadStorage()
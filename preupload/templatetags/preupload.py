@@ -0,0 +1,22 @@
+"""{% preupload_config %}: one form-level config script instead of per-widget attributes."""
+
+from django import template
+from django.utils.html import json_script
+
+from ..widgets import get_preupload_url
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def preupload_config(context):
+    """Render the #preupload-config JSON read by preupload.js (URLs and CSRF token)."""
+    csrf_token = context.get("csrf_token") or ""
+    return json_script(
+        {
+            "preuploadUrl": get_preupload_url(),
+            "statusUrl": get_preupload_url("preupload:status"),
+            "csrfToken": str(csrf_token),
+        },
+        "preupload-config",
+    )
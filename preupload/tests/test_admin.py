@@ -0,0 +1,75 @@
+from django import forms
+from django.contrib import admin
+from django.contrib.auth.models import Permission, User
+from django.contrib.contenttypes.models import ContentType
+from django.test import RequestFactory, TestCase
+
+from preupload.admin import (
+    PreuploadAdminMixin,
+    _preupload_form_class,
+    _preupload_formset_class,
+)
+from preupload.forms import PreuploadFileField, PreuploadFormMixin
+
+
+class PlainForm(forms.Form):
+    file = forms.FileField()
+
+
+PlainFormSet = forms.formset_factory(PlainForm, extra=3)
+
+
+class PermissionInline(PreuploadAdminMixin, admin.TabularInline):
+    model = Permission
+    fields = ["name", "codename"]
+
+
+class AdminClassCacheTestCase(TestCase):
+    def test_form_class_memoized(self):
+        form_class = _preupload_form_class(PlainForm)
+        self.assertTrue(issubclass(form_class, PreuploadFormMixin))
+        self.assertIs(_preupload_form_class(PlainForm), form_class)
+        self.assertIs(_preupload_form_class(form_class), form_class)
+
+    def test_formset_class_memoized(self):
+        formset_class = _preupload_formset_class(PlainFormSet)
+        self.assertIs(_preupload_formset_class(PlainFormSet), formset_class)
+        formset = formset_class()
+        for form in formset.forms:
+            self.assertIsInstance(form.fields["file"], PreuploadFileField)
+
+
+class PermissionAdmin(PreuploadAdminMixin, admin.ModelAdmin):
+    fields = ["name", "content_type", "codename"]
+
+
+class AdminRequestTestCase(TestCase):
+    def setUp(self):
+        self.site = admin.AdminSite()
+        self.site.register(ContentType)
+        self.factory = RequestFactory()
+
+    def request_as(self, user):
+        request = self.factory.get("/")
+        request.user = user
+        return request
+
+    def test_get_form_not_shared_between_users(self):
+        model_admin = PermissionAdmin(Permission, self.site)
+        superuser = User.objects.create_superuser("root")
+        staff = User.objects.create_user("staff", is_staff=True)
+        admin_form = model_admin.get_form(self.request_as(superuser))
+        staff_form = model_admin.get_form(self.request_as(staff))
+        self.assertTrue(issubclass(staff_form, PreuploadFormMixin))
+        self.assertTrue(admin_form.base_fields["content_type"].widget.can_add_related)
+        widget = staff_form.base_fields["content_type"].widget
+        self.assertFalse(widget.can_add_related)
+        self.assertFalse(widget.can_change_related)
+
+    def test_get_formset_prepares_form_class_once(self):
+        inline = PermissionInline(ContentType, self.site)
+        request = self.request_as(User.objects.create_superuser("root"))
+        formset_class = inline.get_formset(request)
+        self.assertTrue(issubclass(formset_class.form, PreuploadFormMixin))
+        formset_class(instance=ContentType(pk=1)).forms
+        self.assertIn("_preupload_prepared", formset_class.form.__dict__)
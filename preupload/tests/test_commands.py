@@ -1,12 +1,23 @@
+import json
+import os
+import shutil
+import tempfile
+import time
 from io import BytesIO, StringIO
 from datetime import timedelta
+from unittest import mock
 
-from django.test import TestCase, override_settings
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.db import connection
 from django.utils import timezone
 from django.core.management import call_command
 
-from preupload.models import Preupload
-from preupload.storage import storage
+from preupload.conf import preupload_config
+from preupload.management.commands.loadtest_preupload import parse_sizes, percentile
+from preupload.models import Preupload, PreuploadDailyStats
+from preupload.registry import CacheRegistry, ModelRegistry
+from preupload.storage import PreuploadStorage, storage
+from preupload.tokens import release_preupload
 
 
 class CleanupCommandTestCase(TestCase):
@@ -31,6 +42,54 @@ class CleanupCommandTestCase(TestCase):
         call_command("cleanup_preuploads", stdout=StringIO(), stderr=StringIO())
         self.assertEqual(Preupload.objects.count(), 0)
 
+    def test_cleanup_keeps_file_shared_with_live_duplicate(self):
+        ref = storage.save(BytesIO(b"x"), name="x.txt")
+        old = Preupload.objects.create(storage_ref=ref, original_filename="x.txt")
+        Preupload.objects.create(storage_ref=ref, original_filename="x.txt")
+        Preupload.objects.filter(pk=old.pk).update(
+            created_at=timezone.now() - timedelta(minutes=61)
+        )
+        call_command("cleanup_preuploads", stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(Preupload.objects.count(), 1)
+        self.assertTrue(storage._storage.exists(ref))
+
+        Preupload.objects.update(created_at=timezone.now() - timedelta(minutes=61))
+        call_command("cleanup_preuploads", stdout=StringIO(), stderr=StringIO())
+        self.assertFalse(Preupload.objects.exists())
+        self.assertFalse(storage._storage.exists(ref))
+
+    def test_cleanup_deletes_file_shared_across_batches(self):
+        ref = storage.save(BytesIO(b"x"), name="x.txt")
+        Preupload.objects.create(storage_ref=ref, original_filename="x.txt")
+        Preupload.objects.create(storage_ref=ref, original_filename="x.txt")
+        Preupload.objects.update(created_at=timezone.now() - timedelta(minutes=61))
+        call_command(
+            "cleanup_preuploads",
+            "--batch-size=1",
+            stdout=StringIO(),
+            stderr=StringIO(),
+        )
+        self.assertFalse(Preupload.objects.exists())
+        self.assertFalse(storage._storage.exists(ref))
+
+    def test_cleanup_retries_failed_file_delete(self):
+        ref = storage.save(BytesIO(b"x"), name="x.txt")
+        p = Preupload.objects.create(storage_ref=ref, original_filename="x.txt")
+        Preupload.objects.filter(pk=p.pk).update(
+            created_at=timezone.now() - timedelta(minutes=61)
+        )
+        out, err = StringIO(), StringIO()
+        with mock.patch.object(storage, "delete", side_effect=OSError("busy")):
+            call_command("cleanup_preuploads", stdout=out, stderr=err)
+        self.assertIn("Failed to delete storage %s" % ref, err.getvalue())
+        self.assertIn("Deleted 0 expired", out.getvalue())
+        self.assertEqual(Preupload.objects.get().storage_ref, ref)
+        self.assertTrue(storage._storage.exists(ref))
+
+        call_command("cleanup_preuploads", stdout=StringIO(), stderr=StringIO())
+        self.assertFalse(Preupload.objects.exists())
+        self.assertFalse(storage._storage.exists(ref))
+
     def test_cleanup_dry_run(self):
         ref = storage.save(BytesIO(b"x"), name="x.txt")
         p = Preupload.objects.create(
@@ -45,3 +104,191 @@ class CleanupCommandTestCase(TestCase):
             "cleanup_preuploads", "--dry-run", stdout=StringIO(), stderr=StringIO()
         )
         self.assertEqual(Preupload.objects.count(), 1)
+
+    def test_cleanup_sweeps_storage_for_expiring_registry(self):
+        old_ref = storage.save(BytesIO(b"old"), name="old.txt")
+        new_ref = storage.save(BytesIO(b"new"), name="new.txt")
+        old_time = time.time() - 61 * 60
+        os.utime(storage._storage.path(old_ref), (old_time, old_time))
+        with mock.patch(
+            "preupload.management.commands.cleanup_preuploads.registry",
+            CacheRegistry(),
+        ):
+            call_command("cleanup_preuploads", stdout=StringIO(), stderr=StringIO())
+        self.assertFalse(storage._storage.exists(old_ref))
+        self.assertTrue(storage._storage.exists(new_ref))
+        storage.delete(new_ref)
+
+    def test_cleanup_drops_expired_buckets(self):
+        location = tempfile.mkdtemp(prefix="preupload_test_cleanup_buckets_")
+        self.addCleanup(shutil.rmtree, location, True)
+        with mock.patch.dict(
+            preupload_config,
+            {
+                "STORAGE": {
+                    "BACKEND": "django.core.files.storage.FileSystemStorage",
+                    "OPTIONS": {"location": location},
+                },
+                "KEY_LAYOUT": "day",
+            },
+        ):
+            bucketed = PreuploadStorage()
+        ref = bucketed._storage.save("preupload/2000/01/01/abc", BytesIO(b"x"))
+        p = Preupload.objects.create(token="t3", storage_ref=ref, original_filename="x")
+        Preupload.objects.filter(pk=p.pk).update(
+            created_at=timezone.now() - timedelta(minutes=61)
+        )
+        out = StringIO()
+        with mock.patch(
+            "preupload.management.commands.cleanup_preuploads.storage", bucketed
+        ):
+            call_command("cleanup_preuploads", stdout=out, stderr=StringIO())
+        self.assertEqual(Preupload.objects.count(), 0)
+        self.assertIn("Dropped 1 expired bucket(s).", out.getvalue())
+        self.assertFalse(os.path.exists(os.path.join(location, "preupload", "2000")))
+
+    def test_cleanup_loop_mode(self):
+        ref = storage.save(BytesIO(b"x"))
+        p = Preupload.objects.create(token="t4", storage_ref=ref, original_filename="x")
+        Preupload.objects.filter(pk=p.pk).update(
+            created_at=timezone.now() - timedelta(minutes=61)
+        )
+        out = StringIO()
+        with mock.patch("time.sleep") as sleep:
+            call_command(
+                "cleanup_preuploads",
+                "--loop",
+                "--iterations=3",
+                "--batch-size=1",
+                "--min-sleep=1",
+                "--max-sleep=8",
+                stdout=out,
+                stderr=StringIO(),
+            )
+        self.assertEqual(Preupload.objects.count(), 0)
+        # Full batch -> min sleep, then idle passes back off.
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [1, 2])
+
+
+class ClaimExpiredTestCase(TestCase):
+    def setUp(self):
+        old = timezone.now() - timedelta(minutes=61)
+        for i in range(3):
+            p = Preupload.objects.create(storage_ref="preupload/%d" % i)
+            Preupload.objects.filter(pk=p.pk).update(created_at=old)
+        self.cutoff = timezone.now() - timedelta(minutes=60)
+        self.registry = ModelRegistry()
+
+    def test_lease_claims_are_disjoint(self):
+        with self.registry.claim_expired(self.cutoff, 2) as first:
+            with self.registry.claim_expired(self.cutoff, 10) as second:
+                pass
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertFalse({r.pk for r in first} & {r.pk for r in second})
+        self.assertEqual(Preupload.objects.exclude(lease_owner="").count(), 3)
+
+    def test_excluded_pks_not_claimed(self):
+        skip = Preupload.objects.order_by("pk")[0].pk
+        for skip_locked in (False, True):
+            with mock.patch.object(
+                connection.features, "has_select_for_update_skip_locked", skip_locked
+            ):
+                with self.registry.claim_expired(
+                    self.cutoff, 10, exclude={skip}
+                ) as claimed:
+                    pass
+            self.assertEqual(len(claimed), 2)
+            self.assertNotIn(skip, {r.pk for r in claimed})
+            Preupload.objects.update(lease_owner="", lease_until=None)
+
+    def test_skip_locked_path(self):
+        with mock.patch.object(
+            connection.features, "has_select_for_update_skip_locked", True
+        ):
+            with self.registry.claim_expired(self.cutoff, 10) as claimed:
+                self.registry.delete_many(claimed)
+        self.assertEqual(len(claimed), 3)
+        self.assertFalse(Preupload.objects.exists())
+
+
+class LoadTestCommandTestCase(TransactionTestCase):
+    @mock.patch.dict(preupload_config, {"STATS": True})
+    def test_json_report(self):
+        out = StringIO()
+        call_command(
+            "loadtest_preupload",
+            "--duration=0.3",
+            "--concurrency=1",
+            "--sizes=1k:3,4k:1",
+            "--json",
+            stdout=out,
+            stderr=StringIO(),
+        )
+        report = json.loads(out.getvalue())
+        for stage in ("preupload", "submit"):
+            row = report["stages"][stage]
+            self.assertGreater(row["requests"], 0)
+            self.assertEqual(row["errors"], 0)
+            self.assertIsNotNone(row["p99_ms"])
+        self.assertEqual(Preupload.objects.count(), 0)
+        self.assertFalse(PreuploadDailyStats.objects.exists())
+
+    def test_parse_sizes_and_percentile(self):
+        self.assertEqual(parse_sizes("512,2k:3"), ([512, 2048], [1.0, 3.0]))
+        self.assertEqual(percentile([1, 2, 3, 4], 50), 2)
+        self.assertEqual(percentile([1, 2, 3, 4], 99), 4)
+        self.assertIsNone(percentile([], 50))
+
+
+class PreuploadStatsCommandTestCase(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        for minutes, size in ((1, 100), (20, 200), (50, 300), (90, None)):
+            ref = storage.save(BytesIO(b"x" * (size or 1)), name="x.txt")
+            p = Preupload.objects.create(
+                storage_ref=ref, original_filename="x.txt", size=size
+            )
+            Preupload.objects.filter(pk=p.pk).update(
+                created_at=now - timedelta(minutes=minutes)
+            )
+            self.addCleanup(storage.delete, ref)
+
+    def report(self, *args):
+        out = StringIO()
+        call_command("preupload_stats", "--json", *args, stdout=out)
+        return json.loads(out.getvalue())
+
+    def test_outstanding_aggregates(self):
+        with self.assertNumQueries(2):
+            report = self.report("--bins=15,60")
+        self.assertIsNone(report["outcomes"])
+        out = report["outstanding"]
+        self.assertEqual(out["count"], 4)
+        self.assertEqual(out["bytes"], 600)
+        self.assertEqual(out["unknown_size"], 1)
+        self.assertEqual(out["expired"], 1)
+        self.assertEqual(out["age_histogram"], {"<15m": 1, "15-60m": 2, ">=60m": 1})
+        self.assertEqual(out["by_status"]["ready"]["count"], 4)
+        self.assertGreaterEqual(out["oldest_age_seconds"], 90 * 60)
+
+    @mock.patch.dict(preupload_config, {"STATS": True})
+    def test_consumed_vs_expired(self):
+        release_preupload(Preupload.objects.get(size=100))
+        call_command("cleanup_preuploads", stdout=StringIO(), stderr=StringIO())
+        outcomes = self.report()["outcomes"]
+        self.assertEqual(outcomes["consumed"], 1)
+        self.assertEqual(outcomes["consumed_bytes"], 100)
+        self.assertEqual(outcomes["expired"], 1)
+        self.assertEqual(outcomes["expired_ratio"], 0.5)
+        self.assertEqual(PreuploadDailyStats.objects.count(), 1)
+
+    def test_storage_sample_and_text_output(self):
+        report = self.report("--sample=10", "--seed=1")
+        self.assertGreater(report["storage_sample"]["sampled"], 0)
+        self.assertEqual(report["storage_sample"]["missing"], 0)
+        out = StringIO()
+        call_command("preupload_stats", "--sample=2", stdout=out)
+        self.assertIn("Outstanding: 4 preupload(s)", out.getvalue())
+        self.assertIn("Age histogram:", out.getvalue())
+        self.assertIn("counters are disabled", out.getvalue())
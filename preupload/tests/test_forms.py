@@ -1,9 +1,16 @@
+from io import BytesIO
+from unittest import mock
+
 from django.test import TestCase, RequestFactory
+from django.contrib.auth.models import Group
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django import forms
 
+from preupload.conf import preupload_config
 from preupload.forms import PreuploadFileField, PreuploadFormMixin
-from preupload.models import Preupload
+from preupload.model_fields import PreuploadFileModelField
+from preupload.models import Preupload, PreuploadDailyStats
 from preupload.storage import storage
 from preupload import tokens
 
@@ -16,6 +23,13 @@ class OptionalImageForm(PreuploadFormMixin, forms.Form):
     thumb = forms.ImageField(required=False)
 
 
+class PolicyForm(PreuploadFormMixin, forms.Form):
+    preupload_policies = {"avatar": {"max_size": 1024, "content_types": ["image/*"]}}
+
+    avatar = forms.ImageField()
+    document = forms.FileField()
+
+
 class FormsTestCase(TestCase):
     def setUp(self):
         self.factory = RequestFactory()
@@ -29,9 +43,7 @@ class FormsTestCase(TestCase):
         self.assertIn("file", form.errors)
 
     def test_form_with_token_resolves_preuploaded_file(self):
-        storage_ref = storage.save(
-            __import__("io").BytesIO(b"preuploaded"), name="s.txt"
-        )
+        storage_ref = storage.save(BytesIO(b"preuploaded"), name="s.txt")
         preupload = Preupload.objects.create(
             token=None,
             storage_ref=storage_ref,
@@ -49,7 +61,7 @@ class FormsTestCase(TestCase):
     def test_form_submit_with_token_only_no_file_uploaded(self):
         """File is resolved from token only; form submit must not re-upload the file."""
         content = b"from-preupload-only"
-        storage_ref = storage.save(__import__("io").BytesIO(content), name="p.txt")
+        storage_ref = storage.save(BytesIO(content), name="p.txt")
         preupload = Preupload.objects.create(
             token=None,
             storage_ref=storage_ref,
@@ -65,6 +77,22 @@ class FormsTestCase(TestCase):
         self.assertEqual(form.cleaned_data["file"].read(), content)
         self.assertEqual(form.cleaned_data["file"].name, "p.txt")
 
+    def test_resolved_file_uses_recorded_content_type(self):
+        storage_ref = storage.save(BytesIO(b"%PDF-1.4"), name="d.pdf")
+        preupload = Preupload.objects.create(
+            token=None,
+            storage_ref=storage_ref,
+            original_filename="d.pdf",
+            content_type="application/pdf",
+        )
+        preupload.token = tokens.generate_token(preupload)
+        preupload.save(update_fields=["token"])
+
+        request = self.factory.post("/", data={"file_token": preupload.token})
+        form = SimpleForm(request.POST, request.FILES, request=request)
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data["file"].content_type, "application/pdf")
+
     def test_form_invalid_token_raises_validation_error(self):
         request = self.factory.post("/", data={"file_token": "bad-token"})
         form = SimpleForm(request.POST, request.FILES, request=request)
@@ -73,7 +101,7 @@ class FormsTestCase(TestCase):
 
     def test_optional_image_clear_checkbox_clears_token(self):
         """Clear checkbox on PreuploadImageWidget clears the field (token ignored)."""
-        storage_ref = storage.save(__import__("io").BytesIO(b"image"), name="img.png")
+        storage_ref = storage.save(BytesIO(b"image"), name="img.png")
         preupload = Preupload.objects.create(
             token=None,
             storage_ref=storage_ref,
@@ -89,3 +117,76 @@ class FormsTestCase(TestCase):
         form = OptionalImageForm(request.POST, request.FILES, request=request)
         self.assertTrue(form.is_valid(), form.errors)
         self.assertFalse(form.cleaned_data["thumb"])
+
+    def test_file_fields_wrapped_once_per_class(self):
+        """Wrapping happens on base_fields; instances only get Django's deepcopy."""
+        SimpleForm()
+        base_field = SimpleForm.base_fields["file"]
+        self.assertIsInstance(base_field, PreuploadFileField)
+        form = SimpleForm()
+        self.assertIsInstance(form.fields["file"], PreuploadFileField)
+        self.assertIsNot(form.fields["file"], base_field)
+        self.assertIs(SimpleForm.base_fields["file"], base_field)
+        self.assertNotIsInstance(SimpleForm.declared_fields["file"], PreuploadFileField)
+
+    def test_preupload_policies_set_on_widgets(self):
+        form = PolicyForm()
+        self.assertEqual(form.fields["avatar"].widget.policy["max_size"], 1024)
+        self.assertIsNone(form.fields["document"].widget.policy)
+
+
+class GroupForm(PreuploadFormMixin, forms.ModelForm):
+    file = forms.FileField()
+
+    class Meta:
+        model = Group
+        fields = ["name"]
+
+
+@mock.patch.dict(preupload_config, {"STATS": True})
+class ReleaseOnSaveTestCase(TestCase):
+    def setUp(self):
+        self.ref = storage.save(BytesIO(b"x"), name="x.txt")
+        self.preupload = Preupload.objects.create(
+            storage_ref=self.ref, original_filename="x.txt", size=1
+        )
+        self.token = tokens.generate_token(self.preupload)
+
+    def assertConsumed(self):
+        self.assertFalse(Preupload.objects.exists())
+        self.assertFalse(storage._storage.exists(self.ref))
+        self.assertEqual(PreuploadDailyStats.objects.get().consumed, 1)
+
+    def test_model_form_save_releases(self):
+        form = GroupForm({"name": "g", "file_token": self.token})
+        self.assertTrue(form.is_valid(), form.errors)
+        with self.captureOnCommitCallbacks(execute=True):
+            form.save()
+        self.assertConsumed()
+
+    def test_commit_false_releases_on_save_m2m(self):
+        form = GroupForm({"name": "g", "file_token": self.token})
+        self.assertTrue(form.is_valid(), form.errors)
+        with self.captureOnCommitCallbacks(execute=True):
+            group = form.save(commit=False)
+        self.assertTrue(Preupload.objects.exists())
+        group.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            form.save_m2m()
+            form.save_m2m()
+        self.assertConsumed()
+
+    def test_model_field_pre_save_releases(self):
+        form = SimpleForm({"file_token": self.token})
+        self.assertTrue(form.is_valid(), form.errors)
+        field = PreuploadFileModelField(upload_to="docs/")
+        field.set_attributes_from_name("file")
+        group = Group(name="g")
+        group.file = field.attr_class(group, field, "x.txt")
+        group.file._file = form.cleaned_data["file"]
+        group.file._committed = False
+        with self.captureOnCommitCallbacks(execute=True):
+            saved = field.pre_save(group, True)
+        self.addCleanup(default_storage.delete, saved.name)
+        self.assertTrue(default_storage.exists(saved.name))
+        self.assertConsumed()
@@ -0,0 +1,57 @@
+import hashlib
+from io import BytesIO
+
+from django.core.files import File
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase
+
+from preupload.ingest import IngestReader, sniff_content_type
+
+
+class SniffContentTypeTestCase(SimpleTestCase):
+    def test_known_signatures(self):
+        self.assertEqual(sniff_content_type(b"%PDF-1.7\n"), "application/pdf")
+        self.assertEqual(sniff_content_type(b"\xff\xd8\xff\xe0"), "image/jpeg")
+        self.assertEqual(
+            sniff_content_type(b"RIFF\x00\x00\x00\x00WEBPVP8 "), "image/webp"
+        )
+        self.assertEqual(sniff_content_type(b"\x00\x00\x00\x18ftypmp42"), "video/mp4")
+
+    def test_unknown_is_octet_stream(self):
+        self.assertEqual(sniff_content_type(b"hello"), "application/octet-stream")
+        self.assertEqual(sniff_content_type(b""), "application/octet-stream")
+
+
+class IngestReaderTestCase(SimpleTestCase):
+    def test_sequential_pass(self):
+        reader = IngestReader(BytesIO(b"abcdef"))
+        while reader.read(4):
+            pass
+        self.assertTrue(reader.complete)
+        self.assertEqual(
+            reader.finish()[:2], (6, hashlib.sha256(b"abcdef").hexdigest())
+        )
+
+    def test_seek_to_start_restarts_pass(self):
+        reader = IngestReader(BytesIO(b"abcdef"))
+        reader.read(3)
+        reader.seek(0)
+        reader.read()
+        self.assertTrue(reader.complete)
+        self.assertEqual(reader.finish()[0], 6)
+
+    def test_size_is_wrapped_file_size(self):
+        upload = SimpleUploadedFile("a.txt", b"abcdef")
+        reader = IngestReader(upload)
+        self.assertEqual(File(reader).size, upload.size)
+        reader.read()
+        self.assertEqual(File(reader).size, 6)
+
+    def test_non_sequential_access_falls_back_to_reread(self):
+        reader = IngestReader(BytesIO(b"abcdef"))
+        reader.seek(2)
+        reader.read()
+        self.assertFalse(reader.complete)
+        size, sha256, _ = reader.finish()
+        self.assertEqual(size, 6)
+        self.assertEqual(sha256, hashlib.sha256(b"abcdef").hexdigest())
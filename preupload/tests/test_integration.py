@@ -118,6 +118,36 @@ class PreuploadIntegrationTestCase(LiveServerTestCase):
         finally:
             os.unlink(path)
 
+    def test_token_restored_after_reload(self):
+        if _skip_if_no_playwright():
+            self.skipTest("playwright not installed")
+
+        from playwright.sync_api import sync_playwright
+
+        with tempfile.NamedTemporaryFile(suffix=".txt", delete=False, mode="wb") as f:
+            f.write(b"reload test file")
+            path = f.name
+        try:
+            with sync_playwright() as p:
+                page, browser = self._new_page(p)
+                page.goto(self.live_server_url + "/form/")
+                page.set_input_files('input[type="file"]', path)
+                page.wait_for_selector(
+                    '[data-preupload-state="ready"]',
+                    timeout=10000,
+                )
+                token_before = page.input_value('input[name="file_token"]')
+                page.reload()
+                page.wait_for_selector(
+                    '[data-preupload-state="ready"]',
+                    timeout=10000,
+                )
+                token_after = page.input_value('input[name="file_token"]')
+                browser.close()
+            self.assertEqual(token_before, token_after)
+        finally:
+            os.unlink(path)
+
     def test_submit_blocked_while_uploading(self):
         if _skip_if_no_playwright():
             self.skipTest("playwright not installed")
@@ -215,3 +245,73 @@ class PreuploadIntegrationTestCase(LiveServerTestCase):
             self.assertEqual(token_value, "")
         finally:
             os.unlink(path)
+
+    def test_widget_added_after_load_is_attached(self):
+        if _skip_if_no_playwright():
+            self.skipTest("playwright not installed")
+
+        from playwright.sync_api import sync_playwright
+
+        with tempfile.NamedTemporaryFile(suffix=".txt", delete=False, mode="wb") as f:
+            f.write(b"dynamic row file")
+            path = f.name
+        try:
+            with sync_playwright() as p:
+                page, browser = self._new_page(p)
+                page.goto(self.live_server_url + "/form/")
+                page.wait_for_function("window.Preupload !== undefined", timeout=10000)
+                # Like the admin's "Add another": clone a widget into the form after load.
+                page.evaluate("""() => {
+                        const row = document.querySelector("[data-preupload]").cloneNode(true);
+                        row.id = "added-row";
+                        row.querySelector('input[type="hidden"]').name = "extra_token";
+                        document.querySelector("form").appendChild(row);
+                    }""")
+                page.set_input_files('#added-row input[type="file"]', path)
+                page.wait_for_selector(
+                    '#added-row[data-preupload-state="ready"]',
+                    timeout=10000,
+                )
+                token_value = page.input_value('input[name="extra_token"]')
+                first_state = page.get_attribute(
+                    "[data-preupload]", "data-preupload-state"
+                )
+                browser.close()
+            self.assertIsNotNone(tokens.resolve_preupload_token(token_value))
+            self.assertIsNone(first_state)
+        finally:
+            os.unlink(path)
+
+    def test_file_picked_before_module_loads(self):
+        if _skip_if_no_playwright():
+            self.skipTest("playwright not installed")
+
+        from playwright.sync_api import sync_playwright
+
+        with tempfile.NamedTemporaryFile(suffix=".txt", delete=False, mode="wb") as f:
+            f.write(b"early file")
+            path = f.name
+        try:
+            with sync_playwright() as p:
+                page, browser = self._new_page(p)
+                held = []
+                page.route("**/preupload.esm.min.js", lambda route: held.append(route))
+                page.goto(
+                    self.live_server_url + "/form/", wait_until="domcontentloaded"
+                )
+                page.set_input_files('input[type="file"]', path)
+                while not held:
+                    page.wait_for_timeout(50)
+                started = page.evaluate("() => window.Preupload !== undefined")
+                for route in held:
+                    route.continue_()
+                page.wait_for_selector(
+                    '[data-preupload-state="ready"]',
+                    timeout=10000,
+                )
+                token_value = page.input_value('input[name="file_token"]')
+                browser.close()
+            self.assertFalse(started)
+            self.assertIsNotNone(tokens.resolve_preupload_token(token_value))
+        finally:
+            os.unlink(path)
@@ -0,0 +1,125 @@
+from unittest import mock
+
+from django import forms
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.signing import BadSignature, SignatureExpired
+from django.test import Client, SimpleTestCase, TestCase
+from django.urls import reverse
+
+from preupload import policies, tokens
+from preupload.forms import PreuploadFormMixin
+from preupload.widgets import PreuploadFileWidget
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 32
+AVATAR = {"max_size": 1024, "extensions": [".png"]}
+VIDEO = {"max_size": 200 * 1024 * 1024}
+
+
+class _PolicyForm(PreuploadFormMixin, forms.Form):
+    preupload_policies = {"avatar": AVATAR, "video": VIDEO}
+    avatar = forms.FileField(required=False)
+    video = forms.FileField(required=False)
+    document = forms.FileField(required=False)
+
+
+class PolicyTestCase(SimpleTestCase):
+    def test_sign_and_load_round_trip(self):
+        signed = policies.sign_policy(
+            {"max_size": 100, "extensions": ["PNG", ".jpg"], "ttl_minutes": 999}
+        )
+        self.assertEqual(
+            policies.load_policy(signed),
+            {"max_size": 100, "extensions": [".jpg", ".png"], "ttl_minutes": 60},
+        )
+        with self.assertRaises(BadSignature):
+            policies.load_policy(signed + "x")
+
+    def test_policy_signed_fresh_on_each_render(self):
+        with mock.patch("django.core.signing.time.time", return_value=1000):
+            old = policies.sign_policy({"max_size": 10})
+        with mock.patch("django.core.signing.time.time", return_value=1002):
+            fresh = policies.sign_policy({"max_size": 10})
+            with mock.patch.dict(policies.preupload_config, {"POLICY_MAX_AGE": 1}):
+                with self.assertRaises(SignatureExpired):
+                    policies.load_policy(old)
+                self.assertEqual(policies.load_policy(fresh), {"max_size": 10})
+
+    def test_unknown_key_rejected(self):
+        with self.assertRaises(ValueError):
+            policies.normalize_policy({"max_bytes": 1})
+
+    def test_content_type_patterns(self):
+        self.assertTrue(policies.content_type_allowed("image/png", ["image/*"]))
+        self.assertTrue(policies.content_type_allowed("Image/PNG", ["image/png"]))
+        self.assertFalse(policies.content_type_allowed("text/plain", ["image/*"]))
+
+    def test_widget_renders_signed_policy(self):
+        html = PreuploadFileWidget(policy={"max_size": 10}).render("f", "")
+        self.assertIn("data-preupload-policy=", html)
+        self.assertNotIn("data-preupload-policy", PreuploadFileWidget().render("f", ""))
+
+
+class PolicyEnforcementTestCase(TestCase):
+    def post(self, policy, name, content, content_type="application/octet-stream"):
+        headers = {}
+        if policy is not None:
+            headers["HTTP_X_PREUPLOAD_POLICY"] = (
+                policy if isinstance(policy, str) else policies.sign_policy(policy)
+            )
+        return self.client.post(
+            reverse("preupload:preupload"),
+            data={"file": SimpleUploadedFile(name, content, content_type)},
+            **headers,
+        )
+
+    def test_invalid_signature_forbidden(self):
+        self.assertEqual(self.post("tampered", "a.png", PNG).status_code, 403)
+
+    def test_policy_size_limit(self):
+        response = self.post({"max_size": 10}, "a.png", PNG)
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response.json()["max_size"], 10)
+
+    def test_policy_may_raise_global_limit(self):
+        content = b"x" * (1024 * 1024 + 1)
+        self.assertEqual(self.post(None, "a.bin", content).status_code, 413)
+        response = self.post({"max_size": 2 * 1024 * 1024}, "a.bin", content)
+        self.assertEqual(response.status_code, 200)
+
+    def test_content_length_checked_before_body(self):
+        response = Client().post(
+            reverse("preupload:preupload"),
+            data=b"",
+            content_type="multipart/form-data; boundary=x",
+            CONTENT_LENGTH=str(10 * 1024 * 1024),
+        )
+        self.assertEqual(response.status_code, 413)
+
+    def test_extension_and_content_type(self):
+        policy = {"extensions": ["png"], "content_types": ["image/*"]}
+        self.assertEqual(self.post(policy, "a.txt", PNG, "image/png").status_code, 415)
+        self.assertEqual(self.post(policy, "a.png", PNG, "text/plain").status_code, 415)
+        # Declared type passes but the magic number is a PDF.
+        response = self.post(policy, "a.png", b"%PDF-1.4", "image/png")
+        self.assertEqual(response.status_code, 415)
+        response = self.post(policy, "a.png", PNG, "image/png")
+        self.assertEqual(response.status_code, 200)
+
+    def test_policy_ttl_recorded(self):
+        response = self.post({"ttl_minutes": 5}, "a.png", PNG)
+        preupload = tokens.resolve_preupload_token(response.json()["token"])
+        self.assertEqual(preupload.ttl_minutes, 5)
+
+    def test_token_bound_to_its_policy(self):
+        no_policy = self.post(None, "evil.exe", b"x" * 5000).json()["token"]
+        avatar = self.post(AVATAR, "a.png", PNG).json()["token"]
+        video = self.post(VIDEO, "v.bin", b"x" * 5000).json()["token"]
+        form = _PolicyForm(
+            {"avatar_token": no_policy, "video_token": avatar, "document_token": video}
+        )
+        self.assertFalse(form.is_valid())
+        self.assertEqual(set(form.errors), {"avatar", "video", "document"})
+        form = _PolicyForm(
+            {"avatar_token": avatar, "video_token": video, "document_token": no_policy}
+        )
+        self.assertTrue(form.is_valid(), form.errors)
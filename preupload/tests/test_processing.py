@@ -0,0 +1,80 @@
+from io import BytesIO
+from unittest import mock
+
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.urls import reverse
+
+from preupload import processing, tokens
+from preupload.conf import preupload_config
+from preupload.models import Preupload
+from preupload.storage import storage
+from preupload.tests.test_forms import SimpleForm
+
+
+def reject_exe(preupload, file):
+    if file.read(2) == b"MZ":
+        raise ValidationError("Executables are not allowed.")
+    return {"checked": True}
+
+
+PROCESSING_CONFIG = {
+    "PROCESSORS": ["preupload.tests.test_processing.reject_exe"],
+    "PROCESSING": {"BACKEND": "preupload.processing.SyncBackend", "TIMEOUT": 0},
+}
+
+
+class ProcessingTestCase(TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(preupload_config, PROCESSING_CONFIG)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for cached in (processing.get_processors, processing._backend):
+            cached.cache_clear()
+            self.addCleanup(cached.cache_clear)
+
+    def upload(self, content):
+        response = self.client.post(
+            reverse("preupload:preupload"),
+            data={"file": SimpleUploadedFile("f.bin", content)},
+        )
+        return response.json()
+
+    def test_accepted_file_records_result(self):
+        data = self.upload(b"hello")
+        self.assertEqual(data["status"], Preupload.STATUS_READY)
+        preupload = tokens.resolve_preupload_token(data["token"])
+        self.assertEqual(preupload.result, {"checked": True})
+        form = SimpleForm(data={"file_token": data["token"]})
+        self.assertTrue(form.is_valid(), form.errors)
+
+    def test_rejected_file_fails_form_clean(self):
+        data = self.upload(b"MZ\x90\x00")
+        self.assertEqual(data["status"], Preupload.STATUS_REJECTED)
+        form = SimpleForm(data={"file_token": data["token"]})
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors["file"], ["Executables are not allowed."])
+
+    def test_pending_file_times_out_at_clean(self):
+        ref = storage.save(BytesIO(b"x"))
+        preupload = Preupload.objects.create(
+            storage_ref=ref, original_filename="x", status=Preupload.STATUS_PENDING
+        )
+        preupload.token = tokens.generate_token(preupload)
+        preupload.save(update_fields=["token"])
+        form = SimpleForm(data={"file_token": preupload.token})
+        self.assertFalse(form.is_valid())
+        self.assertIn("still being processed", form.errors["file"][0])
+
+    def test_wait_for_verdict_picks_up_result(self):
+        ref = storage.save(BytesIO(b"x"))
+        preupload = Preupload.objects.create(
+            storage_ref=ref, original_filename="x", status=Preupload.STATUS_PENDING
+        )
+        stale = Preupload.objects.get(pk=preupload.pk)
+        processing.process(preupload.pk)
+        self.assertEqual(
+            processing.wait_for_verdict(stale, timeout=1).status,
+            Preupload.STATUS_READY,
+        )
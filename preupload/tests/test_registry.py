@@ -0,0 +1,90 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+
+from preupload import tokens
+from preupload.models import Preupload
+from preupload.registry import CacheRegistry, MemoryRegistry, ModelRegistry
+
+
+class RegistryTestMixin:
+    def make_registry(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.registry = self.make_registry()
+
+    def create(self):
+        record = self.registry.create(storage_ref="preupload/x", original_filename="x")
+        self.registry.set_token(record, tokens.generate_token(record))
+        return record
+
+    def test_create_get_delete(self):
+        record = self.create()
+        fetched = self.registry.get(record.pk)
+        self.assertEqual(fetched.storage_ref, "preupload/x")
+        self.assertEqual(fetched.token, record.token)
+        self.registry.delete(fetched)
+        self.assertIsNone(self.registry.get(record.pk))
+
+    def test_resolve_token_through_registry(self):
+        record = self.create()
+        with mock.patch("preupload.tokens.registry", self.registry):
+            resolved = tokens.resolve_preupload_token(record.token)
+        self.assertEqual(resolved.pk, record.pk)
+
+    def test_duplicate_shares_file_and_expiry(self):
+        record = self.create()
+        copy = self.registry.duplicate(record)
+        self.assertNotEqual(copy.pk, record.pk)
+        self.assertEqual(copy.storage_ref, record.storage_ref)
+        self.assertEqual(self.registry.get(copy.pk).expires_at, record.expires_at)
+        self.assertEqual(self.registry.live_refs(["preupload/x"]), {"preupload/x"})
+        self.registry.delete(copy)
+        self.assertEqual(self.registry.live_refs(["preupload/x"]), {"preupload/x"})
+        self.registry.delete(record)
+        self.assertEqual(self.registry.live_refs(["preupload/x"]), set())
+
+
+class ModelRegistryTestCase(RegistryTestMixin, TestCase):
+    def make_registry(self):
+        return ModelRegistry()
+
+    def test_expired(self):
+        record = self.create()
+        Preupload.objects.filter(pk=record.pk).update(
+            created_at=timezone.now() - timedelta(minutes=61)
+        )
+        cutoff = timezone.now() - timedelta(minutes=60)
+        self.assertEqual([r.pk for r in self.registry.expired(cutoff)], [record.pk])
+
+
+class MemoryRegistryTestCase(RegistryTestMixin, TestCase):
+    def make_registry(self):
+        return MemoryRegistry()
+
+    def test_expired(self):
+        record = self.create()
+        record.created_at = timezone.now() - timedelta(minutes=61)
+        cutoff = timezone.now() - timedelta(minutes=60)
+        self.assertEqual([r.pk for r in self.registry.expired(cutoff)], [record.pk])
+        self.assertFalse(Preupload.objects.exists())
+
+
+class CacheRegistryTestCase(RegistryTestMixin, TestCase):
+    def make_registry(self):
+        cache.clear()
+        return CacheRegistry()
+
+    def test_records_have_native_ttl(self):
+        record = self.create()
+        with mock.patch.object(cache, "set") as set_:
+            self.registry.set_token(record, record.token)
+        timeout = set_.call_args[0][2]
+        self.assertTrue(0 < timeout <= 60 * 60)
+        self.assertTrue(self.registry.expires_records)
+        self.assertEqual(list(self.registry.expired(timezone.now())), [])
+        self.assertFalse(Preupload.objects.exists())
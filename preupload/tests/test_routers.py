@@ -0,0 +1,41 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from preupload import tokens
+from preupload.conf import preupload_config
+from preupload.models import Preupload
+from preupload.registry import ModelRegistry
+from preupload.routers import PreuploadRouter
+
+
+class PreuploadRouterTestCase(TestCase):
+    def test_routes_preupload_app_only(self):
+        router = PreuploadRouter()
+        with mock.patch.dict(preupload_config, {"DATABASE": "preupload"}):
+            self.assertEqual(router.db_for_write(Preupload), "preupload")
+            self.assertEqual(router.db_for_read(Preupload), "preupload")
+            self.assertIsNone(router.db_for_write(User))
+            self.assertTrue(router.allow_migrate("preupload", "preupload"))
+            self.assertFalse(router.allow_migrate("default", "preupload"))
+            self.assertIsNone(router.allow_migrate("default", "auth"))
+
+    def test_unset_database_is_noop(self):
+        router = PreuploadRouter()
+        self.assertIsNone(router.db_for_write(Preupload))
+        self.assertIsNone(router.allow_migrate("default", "preupload"))
+
+
+class ModelRegistryDatabaseTestCase(TestCase):
+    databases = {"default", "preupload"}
+
+    def test_registry_uses_configured_alias(self):
+        with mock.patch.dict(preupload_config, {"DATABASE": "preupload"}):
+            registry = ModelRegistry()
+        record = registry.create(storage_ref="preupload/x", original_filename="x")
+        registry.set_token(record, tokens.generate_token(record))
+        self.assertFalse(Preupload.objects.using("default").exists())
+        self.assertEqual(registry.get(record.pk).token, record.token)
+        registry.delete_many([record])
+        self.assertFalse(Preupload.objects.using("preupload").exists())
@@ -1,7 +1,17 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone as dt_timezone
+from io import BytesIO
+from unittest import mock
+
 from django.test import TestCase, override_settings
-from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.utils import timezone
 
-from preupload.storage import storage, PREFIX
+from preupload.conf import preupload_config
+from preupload.storage import LocalHotCache, PreuploadStorage, storage, PREFIX
 
 
 class PreuploadStorageTestCase(TestCase):
@@ -44,3 +54,231 @@ class PreuploadStorageTestCase(TestCase):
             opened.close()
         finally:
             storage.delete(ref)
+
+    def test_ingest_computes_size_digest_and_content_type(self):
+        content = b"\x89PNG\r\n\x1a\n" + b"x" * 100
+        result = storage.ingest(SimpleUploadedFile("a.bin", content), name="a.bin")
+        try:
+            self.assertEqual(result.size, len(content))
+            self.assertEqual(result.sha256, hashlib.sha256(content).hexdigest())
+            self.assertEqual(result.content_type, "image/png")
+        finally:
+            storage.delete(result.storage_ref)
+
+    def test_ingest_moves_temporary_upload_into_place(self):
+        content = b"%PDF-1.4 spooled to disk"
+        upload = TemporaryUploadedFile("t.pdf", "application/pdf", len(content), None)
+        upload.write(content)
+        upload.flush()
+        temp_path = upload.temporary_file_path()
+        temp_inode = os.stat(temp_path).st_ino
+        result = storage.ingest(upload, name="t.pdf")
+        upload.close()
+        try:
+            self.assertFalse(os.path.exists(temp_path))
+            self.assertEqual(
+                os.stat(storage.local_path(result.storage_ref)).st_ino, temp_inode
+            )
+            self.assertEqual(result.size, len(content))
+            self.assertEqual(result.sha256, hashlib.sha256(content).hexdigest())
+            self.assertEqual(result.content_type, "application/pdf")
+            with storage.open(result.storage_ref) as f:
+                self.assertEqual(f.read(), content)
+        finally:
+            storage.delete(result.storage_ref)
+
+
+class BucketedLayoutTestCase(TestCase):
+    def setUp(self):
+        self.location = tempfile.mkdtemp(prefix="preupload_test_buckets_")
+        self.addCleanup(shutil.rmtree, self.location, True)
+        with mock.patch.dict(
+            preupload_config,
+            {
+                "STORAGE": {
+                    "BACKEND": "django.core.files.storage.FileSystemStorage",
+                    "OPTIONS": {"location": self.location},
+                },
+                "KEY_LAYOUT": "hour",
+                "KEY_SHARD_DEPTH": 1,
+            },
+        ):
+            self.storage = PreuploadStorage()
+
+    def test_ref_is_bucketed_and_sharded(self):
+        ref = self.storage.save(BytesIO(b"x"))
+        bucket = datetime.now(dt_timezone.utc).strftime("%Y/%m/%d/%H")
+        name = ref.rsplit("/", 1)[1]
+        self.assertEqual(ref, PREFIX + bucket + "/" + name[:2] + "/" + name)
+        self.assertEqual(self.storage.open(ref).read(), b"x")
+
+    def test_expired_buckets_dropped_whole(self):
+        old_ref = "preupload/2000/01/01/00/ab/abcdef"
+        self.storage._storage.save(old_ref, BytesIO(b"old"))
+        new_ref = self.storage.save(BytesIO(b"new"))
+        now = timezone.now()
+        self.assertEqual(
+            self.storage.expired_buckets(now), ["preupload/2000/01/01/00/"]
+        )
+        self.assertTrue(self.storage.in_expired_bucket(old_ref, now))
+        self.assertFalse(self.storage.in_expired_bucket(new_ref, now))
+        self.storage.delete_bucket("preupload/2000/01/01/00/")
+        self.assertFalse(os.path.exists(os.path.join(self.location, "preupload/2000")))
+        self.assertEqual(self.storage.open(new_ref).read(), b"new")
+        self.assertEqual(self.storage.expired_buckets(now), [])
+
+    def test_bucket_kept_for_one_span_after_it_ends(self):
+        self.storage._storage.save("preupload/2000/01/01/00/ab/abc", BytesIO(b"x"))
+        ref = "preupload/2000/01/01/00/ab/abc"
+        cutoff = datetime(2000, 1, 1, 1, 30, tzinfo=dt_timezone.utc)
+        self.assertEqual(self.storage.expired_buckets(cutoff), [])
+        self.assertFalse(self.storage.in_expired_bucket(ref, cutoff))
+        cutoff = datetime(2000, 1, 1, 2, tzinfo=dt_timezone.utc)
+        self.assertEqual(
+            self.storage.expired_buckets(cutoff), ["preupload/2000/01/01/00/"]
+        )
+        self.assertTrue(self.storage.in_expired_bucket(ref, cutoff))
+
+    def test_s3_bucket_deleted_by_prefix(self):
+        backend = mock.Mock(spec=["bucket", "_normalize_name", "delete"])
+        backend._normalize_name.side_effect = lambda name: "media/" + name
+        self.storage._shards = {"0": backend}
+        self.storage._storage = backend
+        self.storage.delete_bucket("preupload/2000/01/01/00/")
+        backend.bucket.objects.filter.assert_called_once_with(
+            Prefix="media/preupload/2000/01/01/00/"
+        )
+        backend.bucket.objects.filter.return_value.delete.assert_called_once_with()
+        backend.delete.assert_not_called()
+
+
+class StripedStorageTestCase(TestCase):
+    def setUp(self):
+        self.locations = [
+            tempfile.mkdtemp(prefix="preupload_test_stripe_") for _ in range(3)
+        ]
+        for location in self.locations:
+            self.addCleanup(shutil.rmtree, location, True)
+        self.storage = self.make_storage()
+
+    def make_storage(self, **config):
+        shards = [
+            {
+                "BACKEND": "django.core.files.storage.FileSystemStorage",
+                "OPTIONS": {"location": location},
+                "NAME": "v%d" % index,
+            }
+            for index, location in enumerate(self.locations)
+        ]
+        with mock.patch.dict(
+            preupload_config,
+            {"STORAGE": shards, "KEY_LAYOUT": "hour", **config},
+        ):
+            return PreuploadStorage()
+
+    def test_refs_name_their_shard(self):
+        refs = [self.storage.save(BytesIO(b"%d" % i)) for i in range(30)]
+        shards = {self.storage.split_ref(ref)[0] for ref in refs}
+        self.assertEqual(shards, {"v0", "v1", "v2"})
+        for i, ref in enumerate(refs):
+            shard, key = self.storage.split_ref(ref)
+            location = self.locations[int(shard[1:])]
+            self.assertTrue(os.path.exists(os.path.join(location, key)))
+            self.assertEqual(self.storage.open(ref).read(), b"%d" % i)
+            self.assertEqual(self.storage.size(ref), len(b"%d" % i))
+        self.storage.delete(refs[0])
+        shard, key = self.storage.split_ref(refs[0])
+        self.assertFalse(
+            os.path.exists(os.path.join(self.locations[int(shard[1:])], key))
+        )
+
+    def test_unprefixed_ref_uses_first_backend(self):
+        self.storage._storage.save("preupload/legacy", BytesIO(b"old"))
+        self.assertEqual(self.storage.open("preupload/legacy").read(), b"old")
+
+    def test_free_space_striping_skips_full_volume(self):
+        def disk_usage(path):
+            return mock.Mock(free=0 if path.startswith(self.locations[0]) else 10**9)
+
+        striped = self.make_storage(STRIPING="free_space")
+        with mock.patch("preupload.storage.shutil.disk_usage", disk_usage):
+            refs = [striped.save(BytesIO(b"x")) for _ in range(20)]
+        self.assertNotIn("v0", {striped.split_ref(ref)[0] for ref in refs})
+
+    def test_expired_buckets_per_shard(self):
+        self.storage._shards["v1"].save("preupload/2000/01/01/00/abc", BytesIO(b"x"))
+        now = timezone.now()
+        self.assertEqual(
+            self.storage.expired_buckets(now), ["v1:preupload/2000/01/01/00/"]
+        )
+        self.assertTrue(
+            self.storage.in_expired_bucket("v1:preupload/2000/01/01/00/abc", now)
+        )
+        self.storage.delete_bucket("v1:preupload/2000/01/01/00/")
+        self.assertEqual(self.storage.expired_buckets(now), [])
+
+
+class HotCacheTestCase(TestCase):
+    def make_storage(self, backend, options=None):
+        config = {
+            "HOT_CACHE": {
+                "BACKEND": backend,
+                "OPTIONS": options or {},
+                "MAX_FILE_SIZE": 10,
+            }
+        }
+        with mock.patch.dict(preupload_config, config):
+            return PreuploadStorage()
+
+    def test_small_files_served_from_cache(self):
+        hot = self.make_storage("preupload.storage.LocalHotCache")
+        small = hot.save(BytesIO(b"small"))
+        large = hot.save(BytesIO(b"x" * 11))
+        with mock.patch.object(hot._storage, "open") as open_:
+            with hot.open(small) as f:
+                self.assertEqual(f.read(), b"small")
+            self.assertEqual(hot.size(small), 5)
+        open_.assert_not_called()
+        self.assertIsNone(hot._hot_cache.get(large))
+        self.assertEqual(hot.open(large).read(), b"x" * 11)
+        hot.delete(small)
+        hot.delete(large)
+        self.assertIsNone(hot._hot_cache.get(small))
+
+    def test_open_fills_cache_on_miss(self):
+        hot = self.make_storage("preupload.storage.LocalHotCache")
+        small = hot.save(BytesIO(b"small"))
+        large = hot.save(BytesIO(b"x" * 11))
+        # As in another worker process: the upload never passed through this cache.
+        hot._hot_cache = LocalHotCache()
+        self.assertEqual(hot.open(small).read(), b"small")
+        self.assertEqual(hot._hot_cache.get(small), b"small")
+        with mock.patch.object(hot._storage, "open") as open_:
+            self.assertEqual(hot.open(small).read(), b"small")
+        open_.assert_not_called()
+        self.assertEqual(hot.open(large).read(), b"x" * 11)
+        self.assertIsNone(hot._hot_cache.get(large))
+        hot.delete(small)
+        hot.delete(large)
+
+    def test_django_cache_backend(self):
+        hot = self.make_storage(
+            "preupload.storage.DjangoCacheHotCache", {"KEY_PREFIX": "test:blob"}
+        )
+        ref = hot.save(BytesIO(b"cached"))
+        self.assertEqual(hot._hot_cache.get(ref), b"cached")
+        hot.delete(ref)
+        self.assertIsNone(hot._hot_cache.get(ref))
+
+    def test_lru_evicts_by_bytes_and_expires(self):
+        lru = LocalHotCache(MAX_BYTES=10)
+        lru.set("a", b"1234", 60)
+        lru.set("b", b"1234", 60)
+        lru.get("a")
+        lru.set("c", b"1234", 60)
+        self.assertEqual(lru.get("a"), b"1234")
+        self.assertIsNone(lru.get("b"))
+        lru.set("d", b"1", -1)
+        self.assertIsNone(lru.get("d"))
+        lru.delete_prefix("")
+        self.assertIsNone(lru.get("a"))
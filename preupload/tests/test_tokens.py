@@ -1,4 +1,5 @@
 from datetime import timedelta
+from unittest import mock
 
 from django.test import TestCase
 from django.utils import timezone
@@ -33,3 +34,47 @@ class TokensTestCase(TestCase):
             created_at=timezone.now() - timedelta(minutes=61)
         )
         self.assertIsNone(tokens.resolve_preupload_token(self.preupload.token))
+
+    def test_duplicate_and_release(self):
+        copy_token = tokens.duplicate_preupload_token(self.preupload.token)
+        copy = tokens.resolve_preupload_token(copy_token)
+        self.assertNotEqual(copy.pk, self.preupload.pk)
+        self.assertEqual(copy.storage_ref, self.preupload.storage_ref)
+        self.assertIsNone(tokens.duplicate_preupload_token("invalid"))
+
+        tokens.release_preupload(self.preupload)
+        self.assertTrue(storage._storage.exists(copy.storage_ref))
+        self.assertIsNone(tokens.resolve_preupload_token(self.preupload.token))
+        tokens.release_preupload(copy)
+        self.assertFalse(storage._storage.exists(copy.storage_ref))
+        self.assertFalse(Preupload.objects.exists())
+
+    def test_interleaved_releases_delete_shared_file(self):
+        copy = tokens.resolve_preupload_token(
+            tokens.duplicate_preupload_token(self.preupload.token)
+        )
+        live_refs = tokens.registry.live_refs
+
+        def release_copy_first(storage_refs):
+            # The other holder releases between our delete and our reference check.
+            patcher.stop()
+            tokens.release_preupload(copy)
+            return live_refs(storage_refs)
+
+        patcher = mock.patch.object(
+            tokens.registry, "live_refs", side_effect=release_copy_first
+        )
+        patcher.start()
+        tokens.release_preupload(self.preupload)
+        self.assertFalse(Preupload.objects.exists())
+        self.assertFalse(storage._storage.exists(self.preupload.storage_ref))
+
+    def test_failed_file_delete_keeps_a_record(self):
+        with mock.patch.object(storage, "delete", side_effect=OSError("busy")):
+            with self.assertRaises(OSError):
+                tokens.release_preupload(self.preupload)
+        self.assertIsNone(tokens.resolve_preupload_token(self.preupload.token))
+        retry = Preupload.objects.get()
+        self.assertEqual(retry.storage_ref, self.preupload.storage_ref)
+        self.assertEqual(retry.created_at, self.preupload.created_at)
+        self.assertTrue(storage._storage.exists(self.preupload.storage_ref))
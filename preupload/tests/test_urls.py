@@ -9,3 +9,8 @@ class UrlsTestCase(TestCase):
         url = reverse("preupload:preupload")
         self.assertEqual(url, "/preupload/preupload/")
         self.assertEqual(resolve(url).func, views.preupload)
+
+    def test_status_url_resolves_to_view(self):
+        url = reverse("preupload:status")
+        self.assertEqual(url, "/preupload/status/")
+        self.assertEqual(resolve(url).func, views.status)
@@ -1,8 +1,11 @@
+from unittest import mock
+
 from django.test import TestCase, Client
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
 
 from preupload import tokens
+from preupload.conf import preupload_config
 
 
 class PreuploadViewTestCase(TestCase):
@@ -27,6 +30,12 @@ class PreuploadViewTestCase(TestCase):
         self.assertEqual(data["error"], "File too large")
         self.assertEqual(data["max_size"], 1024 * 1024)
 
+    def test_post_without_csrf_token_rejected(self):
+        client = Client(enforce_csrf_checks=True)
+        file = SimpleUploadedFile("a.txt", b"content", "text/plain")
+        response = client.post(reverse("preupload:preupload"), data={"file": file})
+        self.assertEqual(response.status_code, 403)
+
     def test_post_valid_file_returns_200_and_token(self):
         file = SimpleUploadedFile("a.txt", b"content", "text/plain")
         response = self.client.post(
@@ -41,3 +50,100 @@ class PreuploadViewTestCase(TestCase):
         preupload = tokens.resolve_preupload_token(data["token"])
         self.assertIsNotNone(preupload)
         self.assertEqual(preupload.original_filename, "a.txt")
+        self.assertEqual(data["size"], 7)
+        self.assertEqual(preupload.size, 7)
+        self.assertEqual(len(preupload.sha256), 64)
+        self.assertEqual(preupload.content_type, "application/octet-stream")
+
+
+class StatusViewTestCase(TestCase):
+    def setUp(self):
+        file = SimpleUploadedFile("s.txt", b"status", "text/plain")
+        response = self.client.post(reverse("preupload:preupload"), data={"file": file})
+        self.token = response.json()["token"]
+
+    def test_valid_token_returns_metadata(self):
+        with mock.patch("preupload.storage.storage.open") as open_:
+            response = self.client.get(
+                reverse("preupload:status"), {"token": self.token}
+            )
+        open_.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data["valid"])
+        self.assertEqual(data["original_filename"], "s.txt")
+        self.assertEqual(data["size"], 6)
+
+    def test_head_and_invalid_token(self):
+        url = reverse("preupload:status")
+        self.assertEqual(self.client.head(url, {"token": self.token}).status_code, 200)
+        response = self.client.get(url, {"token": "bad"})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {"valid": False})
+
+    def test_post_not_allowed(self):
+        response = self.client.post(reverse("preupload:status"), {"token": self.token})
+        self.assertEqual(response.status_code, 405)
+
+
+class DownloadViewTestCase(TestCase):
+    content = b"0123456789"
+
+    def setUp(self):
+        file = SimpleUploadedFile("d.txt", self.content, "text/plain")
+        response = self.client.post(reverse("preupload:preupload"), data={"file": file})
+        self.token = response.json()["token"]
+        self.url = reverse("preupload:download")
+        self.etag = '"%s"' % tokens.resolve_preupload_token(self.token).sha256
+
+    def test_full_download(self):
+        response = self.client.get(self.url, {"token": self.token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.content)
+        self.assertEqual(response["ETag"], self.etag)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(response["Content-Type"], "application/octet-stream")
+        self.assertEqual(response["Content-Disposition"], 'inline; filename="d.txt"')
+
+    def test_range_request(self):
+        response = self.client.get(
+            self.url, {"token": self.token}, HTTP_RANGE="bytes=2-4"
+        )
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), b"234")
+        self.assertEqual(response["Content-Range"], "bytes 2-4/10")
+        response = self.client.get(
+            self.url, {"token": self.token}, HTTP_RANGE="bytes=-3"
+        )
+        self.assertEqual(b"".join(response.streaming_content), b"789")
+        response = self.client.get(
+            self.url, {"token": self.token}, HTTP_RANGE="bytes=20-"
+        )
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */10")
+
+    def test_if_none_match_returns_304(self):
+        response = self.client.get(
+            self.url, {"token": self.token}, HTTP_IF_NONE_MATCH=self.etag
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_invalid_token_returns_404(self):
+        response = self.client.get(self.url, {"token": "bad"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_x_accel_redirect(self):
+        sendfile = {"HEADER": "X-Accel-Redirect", "PREFIX": "/internal/"}
+        with mock.patch.dict(preupload_config, {"SENDFILE": sendfile}):
+            response = self.client.get(self.url, {"token": self.token})
+        preupload = tokens.resolve_preupload_token(self.token)
+        self.assertEqual(
+            response["X-Accel-Redirect"], "/internal/" + preupload.storage_ref
+        )
+        self.assertEqual(response.content, b"")
+
+    def test_x_sendfile(self):
+        with mock.patch.dict(preupload_config, {"SENDFILE": {"HEADER": "X-Sendfile"}}):
+            response = self.client.get(self.url, {"token": self.token})
+        with open(response["X-Sendfile"], "rb") as f:
+            self.assertEqual(f.read(), self.content)
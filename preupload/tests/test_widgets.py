@@ -1,6 +1,15 @@
+import pathlib
+from unittest import mock
+
+from django.template import Context, Template
 from django.test import TestCase
 
-from preupload.widgets import PreuploadFileWidget
+from preupload.conf import preupload_config
+from preupload.widgets import (
+    PreuploadClearableFileWidget,
+    PreuploadFileWidget,
+    get_preupload_url,
+)
 
 
 class PreuploadFileWidgetTestCase(TestCase):
@@ -48,3 +57,60 @@ class PreuploadFileWidgetTestCase(TestCase):
             name="myfile",
         )
         self.assertTrue(omitted)
+
+    def test_render_includes_preupload_url(self):
+        html = PreuploadFileWidget().render("myfile", "tok")
+        self.assertIn('data-preupload-url="/preupload/preupload/"', html)
+        self.assertIn('data-preupload-status-url="/preupload/status/"', html)
+        self.assertIn('name="myfile_token" value="tok"', html)
+
+    def test_inline_render_matches_template_render(self):
+        for widget in (PreuploadFileWidget(), PreuploadClearableFileWidget()):
+            expected = widget.render("myfile", "tok", attrs={"id": "id_myfile"})
+            with mock.patch.dict(preupload_config, {"WIDGET_INLINE_RENDER": True}):
+                html = widget.render("myfile", "tok", attrs={"id": "id_myfile"})
+            self.assertHTMLEqual(html, expected)
+
+    def test_config_attrs_can_be_hoisted_to_form(self):
+        with mock.patch.dict(preupload_config, {"WIDGET_CONFIG_ATTRS": False}):
+            html = PreuploadFileWidget().render("myfile", "")
+        self.assertIn("data-preupload", html)
+        self.assertNotIn("data-preupload-url", html)
+
+    def test_preupload_config_tag(self):
+        html = Template("{% load preupload %}{% preupload_config %}").render(
+            Context({"csrf_token": "abc"})
+        )
+        self.assertIn('id="preupload-config"', html)
+        self.assertIn(get_preupload_url(), html)
+        self.assertIn('"csrfToken": "abc"', html)
+
+    def test_media_names_module_through_static(self):
+        def hashed(path):
+            return "/static/" + path.replace(".js", ".abc123.js")
+
+        media = PreuploadFileWidget().media + PreuploadClearableFileWidget().media
+        with mock.patch("preupload.widgets.static", hashed):
+            html = str(media)
+        self.assertEqual(html.count("<script"), 1)
+        self.assertIn('src="/static/preupload/js/preupload.abc123.js"', html)
+        self.assertIn(
+            'data-preupload-module="/static/preupload/js/preupload.esm.min.abc123.js"',
+            html,
+        )
+
+
+class StaticBuildTestCase(TestCase):
+    def test_minified_module_is_up_to_date(self):
+        try:
+            import rjsmin
+        except ImportError:
+            self.skipTest("rjsmin not installed")
+        js_dir = pathlib.Path(__file__).resolve().parent.parent / "static/preupload/js"
+        source = (js_dir / "preupload.esm.js").read_text(encoding="utf-8")
+        built = (js_dir / "preupload.esm.min.js").read_text(encoding="utf-8")
+        self.assertEqual(
+            built,
+            rjsmin.jsmin(source) + "\n",
+            "Run scripts/build_static.py to rebuild preupload.esm.min.js.",
+        )
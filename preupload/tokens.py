@@ -1,12 +1,13 @@
-"""Signed token generation and validation for preupload resolution."""
-
-from datetime import timedelta
+"""Signed token generation and validation for preupload resolution; duplicating and releasing preuploads."""
 
 from django.core.signing import Signer, BadSignature
+from django.db import transaction
 from django.utils import timezone
 
-from .conf import preupload_config
+from . import processing, stats
 from .models import Preupload
+from .registry import registry
+from .storage import storage
 
 _signer = Signer()
 
@@ -18,16 +19,71 @@ def generate_token(preupload):
 
 
 def resolve_preupload_token(token):
-    """Verify signature, load Preupload, check expiry (created_at + TTL). Return instance or None."""
+    """Verify signature, load Preupload from the registry, check expiry (created_at + TTL). Return instance or None."""
     if not (token and token.strip()):
         return None
     try:
         pk = int(_signer.unsign(token.strip()))
-        preupload = Preupload.objects.get(pk=pk)
-    except (BadSignature, ValueError, TypeError, Preupload.DoesNotExist):
+    except (BadSignature, ValueError, TypeError):
+        return None
+    preupload = registry.get(pk)
+    if preupload is None:
         return None
-    if timezone.now() > preupload.created_at + timedelta(
-        minutes=preupload_config["TTL_MINUTES"]
-    ):
+    if timezone.now() > preupload.expires_at:
         return None
     return preupload
+
+
+def duplicate_preupload_token(token):
+    """
+    Return a token for a new preupload sharing token's file (e.g. for a copied formset row),
+    or None if token does not resolve. Costs a registry record, not a file copy.
+    """
+    preupload = resolve_preupload_token(token)
+    if preupload is None:
+        return None
+    copy = registry.duplicate(preupload)
+    registry.set_token(copy, generate_token(copy))
+    if copy.status == Preupload.STATUS_PENDING:
+        processing.submit(copy)
+    return copy.token
+
+
+def release_preupload(preupload, record_stats=True):
+    """
+    Delete preupload once its file has been saved elsewhere. The preuploaded file is
+    deleted too, unless a duplicate still references it. record_stats=False keeps it
+    out of the "consumed" counter (e.g. synthetic load).
+    """
+    registry.delete(preupload)
+    # Checked after deleting our own record, so concurrent releases of duplicates
+    # cannot each see the other and both keep the file.
+    if preupload.storage_ref not in registry.live_refs([preupload.storage_ref]):
+        try:
+            storage.delete(preupload.storage_ref)
+        except Exception:
+            # Put a record back (same created_at) so cleanup retries the file later.
+            registry.duplicate(preupload)
+            raise
+    if record_stats:
+        stats.record_outcome("consumed", 1, preupload.size or 0)
+
+
+def release_uploaded_file(uploaded, using=None):
+    """
+    Release the preupload behind a file that PreuploadFileField/PreuploadImageField
+    resolved from a token, once the transaction on using commits (at once outside
+    one). No-op for other files and for files already released.
+    """
+    preupload = getattr(uploaded, "__dict__", {}).pop("preupload", None)
+    if preupload is None:
+        return
+
+    def release():
+        try:
+            release_preupload(preupload)
+        except Exception:
+            # The object is saved; a record was put back so cleanup retries the file.
+            pass
+
+    transaction.on_commit(release, using=using)
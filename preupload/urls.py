@@ -6,4 +6,6 @@ app_name = "preupload"
 
 urlpatterns = [
     path("preupload/", views.preupload, name="preupload"),
+    path("status/", views.status, name="status"),
+    path("download/", views.download, name="download"),
 ]
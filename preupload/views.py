@@ -1,37 +1,252 @@
-"""Preupload endpoint: accept POST file, store it, return signed token."""
+"""Preupload endpoints: accept POST file, store it, return signed token; report token status; serve the file."""
 
-from django.http import JsonResponse
+import re
+from urllib.parse import quote
+
+from django.http import (
+    FileResponse,
+    HttpResponse,
+    HttpResponseNotModified,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.core.signing import BadSignature
+from django.middleware.csrf import CsrfViewMiddleware
+from django.views.decorators.cache import never_cache
+from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 
 from .conf import preupload_config
+from .ingest import DEFAULT_CONTENT_TYPE
 from .models import Preupload
+from . import policies
+from . import processing
+from .registry import registry
 from .storage import storage
 from . import tokens
 
+# Allowance for multipart boundaries, headers and the CSRF field in Content-Length.
+MULTIPART_OVERHEAD = 16 * 1024
+
+
+def _too_large(max_size):
+    return JsonResponse({"error": "File too large", "max_size": max_size}, status=413)
+
+
+def _not_allowed(policy):
+    return JsonResponse(
+        {
+            "error": "File type not allowed",
+            "extensions": policy.get("extensions", []),
+            "content_types": policy.get("content_types", []),
+        },
+        status=415,
+    )
+
 
+@csrf_exempt
 @require_http_methods(["POST"])
 def preupload(request):
-    """POST one file; validate size, store, create Preupload, return token."""
+    """
+    POST one file; verify the widget's signed policy (X-Preupload-Policy) and the
+    declared Content-Length before the body is read, then CSRF, store, register, return token.
+    """
+    policy = {}
+    if request.headers.get("X-Preupload-Policy"):
+        try:
+            policy = policies.load_policy(request.headers["X-Preupload-Policy"])
+        except BadSignature:
+            return JsonResponse({"error": "Invalid upload policy"}, status=403)
+    max_size = policy.get("max_size") or preupload_config["MAX_UPLOAD_SIZE"]
+    try:
+        content_length = int(request.META.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        content_length = 0
+    if content_length > max_size + MULTIPART_OVERHEAD:
+        return _too_large(max_size)
+    # CSRF is checked here, after the cheap checks, because it reads the body.
+    rejected = CsrfViewMiddleware(lambda r: None).process_view(request, None, (), {})
+    if rejected is not None:
+        return rejected
     file = next(iter(request.FILES.values()), None) if request.FILES else None
     if not file:
         return JsonResponse({"error": "No file uploaded"}, status=400)
-    if file.size > preupload_config["MAX_UPLOAD_SIZE"]:
-        return JsonResponse(
-            {
-                "error": "File too large",
-                "max_size": preupload_config["MAX_UPLOAD_SIZE"],
-            },
-            status=413,
-        )
+    if file.size > max_size:
+        return _too_large(max_size)
+    if "extensions" in policy and not policies.extension_allowed(
+        file.name, policy["extensions"]
+    ):
+        return _not_allowed(policy)
+    if "content_types" in policy and not policies.content_type_allowed(
+        file.content_type, policy["content_types"]
+    ):
+        return _not_allowed(policy)
     try:
-        storage_ref = storage.save(file, name=file.name)
+        result = storage.ingest(file, name=file.name)
     except Exception:
         return JsonResponse({"error": "Storage failed"}, status=500)
+    if (
+        "content_types" in policy
+        and result.content_type != DEFAULT_CONTENT_TYPE
+        and not policies.content_type_allowed(
+            result.content_type, policy["content_types"]
+        )
+    ):
+        # Declared type passed but the magic number says otherwise.
+        storage.delete(result.storage_ref)
+        return _not_allowed(policy)
     original_filename = file.name or "upload"
-    preupload = Preupload(storage_ref=storage_ref, original_filename=original_filename)
-    preupload.save()
-    preupload.token = tokens.generate_token(preupload)
-    preupload.save(update_fields=["token"])
+    process = bool(processing.get_processors())
+    preupload = registry.create(
+        storage_ref=result.storage_ref,
+        original_filename=original_filename,
+        size=result.size,
+        sha256=result.sha256,
+        content_type=result.content_type,
+        status=Preupload.STATUS_PENDING if process else Preupload.STATUS_READY,
+        ttl_minutes=policy.get("ttl_minutes"),
+        policy_digest=policies.policy_digest(policy),
+    )
+    registry.set_token(preupload, tokens.generate_token(preupload))
+    if process:
+        processing.submit(preupload)
+    return JsonResponse(
+        {
+            "token": preupload.token,
+            "original_filename": original_filename,
+            "size": preupload.size,
+            "content_type": preupload.content_type,
+            "status": preupload.status,
+        }
+    )
+
+
+@never_cache
+@require_http_methods(["GET", "HEAD"])
+def status(request):
+    """GET/HEAD ?token=...; 200 with metadata if the token resolves, else 404. No storage I/O."""
+    preupload = tokens.resolve_preupload_token(request.GET.get("token", ""))
+    if preupload is None:
+        return JsonResponse({"valid": False}, status=404)
     return JsonResponse(
-        {"token": preupload.token, "original_filename": original_filename}
+        {
+            "valid": True,
+            "original_filename": preupload.original_filename,
+            "size": preupload.size,
+            "content_type": preupload.content_type,
+            "status": preupload.status,
+        }
     )
+
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _parse_range(header, size):
+    """
+    Parse a single-range Range header against size.
+    Return (start, end) inclusive, None to serve the whole file, or False if unsatisfiable.
+    """
+    match = _RANGE_RE.match(header.strip())
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start > end or start >= size:
+        return False
+    return start, end
+
+
+def _content_disposition(filename):
+    """inline Content-Disposition for filename (RFC 6266; ASCII or RFC 5987)."""
+    filename = re.sub(r"[\r\n]", "", filename)
+    try:
+        filename.encode("ascii")
+    except UnicodeEncodeError:
+        return "inline; filename*=utf-8''%s" % quote(filename)
+    return 'inline; filename="%s"' % filename.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _iter_range(f, start, length, chunk_size=64 * 2**10):
+    try:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(chunk_size, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        f.close()
+
+
+def _sendfile_response(preupload, sendfile):
+    """Delegate the body to the web server (X-Accel-Redirect or X-Sendfile); None if not local."""
+    header = sendfile.get("HEADER", "X-Accel-Redirect")
+    if header == "X-Accel-Redirect":
+        shard, key = storage.split_ref(preupload.storage_ref)
+        value = sendfile.get("PREFIX", "/") + (shard + "/" if shard else "") + key
+    else:
+        value = storage.local_path(preupload.storage_ref)
+        if value is None:
+            return None
+    response = HttpResponse()
+    response[header] = value
+    return response
+
+
+@require_http_methods(["GET", "HEAD"])
+def download(request):
+    """
+    GET/HEAD ?token=...; serve the preuploaded file to whoever holds the token.
+    ETag is the SHA-256; single Range requests get 206. With PREUPLOAD["SENDFILE"]
+    the web server sends the bytes (and handles ranges itself).
+    """
+    preupload = tokens.resolve_preupload_token(request.GET.get("token", ""))
+    if preupload is None or preupload.status != Preupload.STATUS_READY:
+        return JsonResponse({"error": "Not found"}, status=404)
+    etag = '"%s"' % preupload.sha256 if preupload.sha256 else None
+    if etag and etag in request.headers.get("If-None-Match", ""):
+        response = HttpResponseNotModified()
+        response["ETag"] = etag
+        return response
+
+    sendfile = preupload_config["SENDFILE"]
+    response = _sendfile_response(preupload, sendfile) if sendfile else None
+    if response is None:
+        size = preupload.size
+        if size is None:
+            size = storage.size(preupload.storage_ref)
+        byte_range = None
+        range_header = request.headers.get("Range")
+        if_range = request.headers.get("If-Range")
+        if range_header and (not if_range or if_range == etag):
+            byte_range = _parse_range(range_header, size)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = "bytes */%d" % size
+            return response
+        f = storage.open(preupload.storage_ref)
+        if byte_range:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                _iter_range(f, start, end - start + 1), status=206
+            )
+            response["Content-Range"] = "bytes %d-%d/%d" % (start, end, size)
+            response["Content-Length"] = str(end - start + 1)
+        else:
+            response = FileResponse(f)
+            response["Content-Length"] = str(size)
+        response["Accept-Ranges"] = "bytes"
+    response["Content-Type"] = preupload.content_type or DEFAULT_CONTENT_TYPE
+    response["Content-Disposition"] = _content_disposition(preupload.original_filename)
+    response["X-Content-Type-Options"] = "nosniff"
+    response["Cache-Control"] = "private, no-cache"
+    if etag:
+        response["ETag"] = etag
+    return response
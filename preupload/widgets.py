@@ -1,14 +1,78 @@
+from functools import lru_cache
+
+import django
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 from django.forms import ClearableFileInput, FileInput
-from django.urls import reverse
+from django.templatetags.static import static
+from django.urls import get_script_prefix, get_urlconf, reverse
+from django.utils.html import format_html
+
+from .conf import preupload_config
+from .policies import sign_policy
+
+
+@lru_cache(maxsize=None)
+def _reverse_preupload_url(viewname, urlconf, script_prefix):
+    return reverse(viewname, urlconf=urlconf)
+
+
+def get_preupload_url(viewname="preupload:preupload"):
+    """Return a preupload app URL, reversed once per urlconf and script prefix."""
+    return _reverse_preupload_url(viewname, get_urlconf(), get_script_prefix())
+
+
+@receiver(setting_changed)
+def _clear_preupload_url_cache(setting, **kwargs):
+    if setting == "ROOT_URLCONF":
+        _reverse_preupload_url.cache_clear()
+
+
+class _LoaderScript:
+    """
+    Media script tag for preupload.js that names the module's static() URL in
+    data-preupload-module, so hashed (ManifestStaticFilesStorage) names are loaded.
+    """
+
+    def __html__(self):
+        return format_html(
+            '<script src="{}" data-preupload-module="{}"></script>',
+            static("preupload/js/preupload.js"),
+            static("preupload/js/preupload.esm.min.js"),
+        )
+
+    def __eq__(self, other):
+        return isinstance(other, _LoaderScript)
+
+    def __hash__(self):
+        return hash(_LoaderScript)
 
 
 class PreuploadWidgetMixin:
-    """Adds hidden token input and preupload URL/CSRF to context; subclasses set super_template."""
+    """
+    Adds hidden token input and preupload URL/CSRF to context; subclasses set super_template.
+    policy: optional upload policy (max_size, extensions, content_types, ttl_minutes),
+    rendered signed and enforced by preupload.js and the preupload endpoint.
+    """
 
     template_name = "preupload/widgets/preupload.html"
+    policy = None
 
     class Media:
-        js = ("preupload/js/preupload.js",)
+        # Media accepts objects with __html__ from Django 4.1; older versions get the
+        # plain path and the loader resolves the module next to itself.
+        js = (
+            (
+                _LoaderScript()
+                if django.VERSION >= (4, 1)
+                else "preupload/js/preupload.js"
+            ),
+        )
+
+    def __init__(self, attrs=None, policy=None):
+        super().__init__(attrs)
+        if policy is not None:
+            self.policy = policy
 
     def get_context(self, name, value, attrs):
         context = super().get_context(name, value, attrs)
@@ -17,14 +81,54 @@ class PreuploadWidgetMixin:
         context["widget"]["token_value"] = (
             value if (value and isinstance(value, str)) else ""
         )
-        context["widget"]["preupload_url"] = getattr(
-            self, "preupload_url", None
-        ) or reverse("preupload:preupload")
-        context["widget"]["preupload_csrf_token"] = getattr(
-            self, "preupload_csrf_token", ""
+        if preupload_config["WIDGET_CONFIG_ATTRS"]:
+            context["widget"]["preupload_url"] = (
+                getattr(self, "preupload_url", None) or get_preupload_url()
+            )
+            context["widget"]["preupload_csrf_token"] = getattr(
+                self, "preupload_csrf_token", ""
+            )
+            context["widget"]["preupload_status_url"] = get_preupload_url(
+                "preupload:status"
+            )
+        else:
+            context["widget"]["preupload_url"] = ""
+            context["widget"]["preupload_csrf_token"] = ""
+            context["widget"]["preupload_status_url"] = ""
+        context["widget"]["preupload_policy"] = (
+            sign_policy(self.policy) if self.policy else ""
         )
         return context
 
+    def render(self, name, value, attrs=None, renderer=None):
+        if not preupload_config["WIDGET_INLINE_RENDER"]:
+            return super().render(name, value, attrs=attrs, renderer=renderer)
+        # Same markup as preupload.html, without the wrapper template and include.
+        context = self.get_context(name, value, attrs)
+        widget = context["widget"]
+        config_attrs = ""
+        if widget["preupload_policy"]:
+            config_attrs = format_html(
+                ' data-preupload-policy="{}"', widget["preupload_policy"]
+            )
+        if widget["preupload_url"]:
+            config_attrs = format_html(
+                '{} data-preupload-url="{}" data-preupload-csrf-token="{}"'
+                ' data-preupload-status-url="{}"',
+                config_attrs,
+                widget["preupload_url"],
+                widget["preupload_csrf_token"],
+                widget["preupload_status_url"],
+            )
+        return format_html(
+            '<div class="preupload-widget" data-preupload{}>\n    {}\n'
+            '    <input type="hidden" name="{}" value="{}">\n</div>',
+            config_attrs,
+            self._render(self.super_template, context, renderer),
+            widget["name_token"],
+            widget["token_value"],
+        )
+
     def value_from_datadict(self, data, files, name):
         return data.get(name + "_token", "")
 
@@ -0,0 +1,21 @@
+"""Build preupload.esm.min.js from preupload.esm.js. Requires rjsmin (pip install -e .[dev])."""
+
+import pathlib
+
+import rjsmin
+
+JS_DIR = (
+    pathlib.Path(__file__).resolve().parent.parent / "preupload/static/preupload/js"
+)
+BUILDS = {"preupload.esm.js": "preupload.esm.min.js"}
+
+
+def main():
+    for source, target in BUILDS.items():
+        code = (JS_DIR / source).read_text(encoding="utf-8")
+        (JS_DIR / target).write_text(rjsmin.jsmin(code) + "\n", encoding="utf-8")
+        print("%s -> %s" % (source, target))
+
+
+if __name__ == "__main__":
+    main()